@@ -0,0 +1,235 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import aiomysql
+from aiomysql import Error
+from config import DB_CONFIG, DB_POOL_CONFIG, LOYALTY_FREE_TRIP
+from profiles import UserProfile, profile_cache
+
+_pool = None
+_pool_lock = None
+
+
+async def get_pool():
+    """Асинхронный пул соединений (создаётся при первом обращении)"""
+    global _pool, _pool_lock
+    if _pool is None:
+        if _pool_lock is None:
+            # Создаём внутри работающего цикла событий, а не при импорте
+            _pool_lock = asyncio.Lock()
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await aiomysql.create_pool(
+                    host=DB_CONFIG['host'],
+                    user=DB_CONFIG['user'],
+                    password=DB_CONFIG['password'],
+                    db=DB_CONFIG['database'],
+                    minsize=DB_POOL_CONFIG['size'],
+                    maxsize=DB_POOL_CONFIG['size'] + DB_POOL_CONFIG['max_overflow'],
+                    pool_recycle=DB_POOL_CONFIG['idle_timeout'],
+                    autocommit=True
+                )
+    return _pool
+
+
+async def close_pool():
+    """Закрыть пул соединений (при остановке бота)"""
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+        _pool = None
+
+
+def pool_stats():
+    """Состояние пула для мониторинга: размер, свободные и занятые соединения"""
+    if _pool is None:
+        return {'size': 0, 'free': 0, 'used': 0, 'minsize': DB_POOL_CONFIG['size'],
+                'maxsize': DB_POOL_CONFIG['size'] + DB_POOL_CONFIG['max_overflow']}
+    return {
+        'size': _pool.size,
+        'free': _pool.freesize,
+        'used': _pool.size - _pool.freesize,
+        'minsize': _pool.minsize,
+        'maxsize': _pool.maxsize,
+    }
+
+
+async def _run(query, params, fetch):
+    try:
+        pool = await get_pool()
+        async with pool.acquire() as connection:
+            async with connection.cursor() as cursor:
+                await cursor.execute(query, params)
+                if fetch == 'one':
+                    return await cursor.fetchone()
+                if fetch == 'all':
+                    return await cursor.fetchall()
+                if fetch == 'id':
+                    return cursor.lastrowid
+                return cursor.rowcount
+    except Error as e:
+        print(f"Ошибка выполнения запроса: {e}")
+        return None
+
+
+async def fetchone(query, params=()):
+    """Выполнить запрос и вернуть первую строку"""
+    return await _run(query, params, 'one')
+
+
+async def fetchall(query, params=()):
+    """Выполнить запрос и вернуть все строки"""
+    return await _run(query, params, 'all')
+
+
+async def execute(query, params=()):
+    """Выполнить запрос на изменение и вернуть число затронутых строк"""
+    return await _run(query, params, None)
+
+
+async def insert(query, params=()):
+    """Выполнить INSERT и вернуть LAST_INSERT_ID из ответа сервера"""
+    return await _run(query, params, 'id')
+
+
+async def stream(query, params=(), batch=1000):
+    """Построчно читать результат серверным курсором (SSCursor), не загружая его в память.
+
+    Асинхронный генератор пачек строк. Соединение занято, пока генератор не
+    дочитан или не закрыт, поэтому между пачками не стоит долго ждать.
+    """
+    pool = await get_pool()
+    async with pool.acquire() as connection:
+        async with connection.cursor(aiomysql.SSCursor) as cursor:
+            await cursor.execute(query, params)
+            while True:
+                rows = await cursor.fetchmany(batch)
+                if not rows:
+                    break
+                yield rows
+
+
+@asynccontextmanager
+async def transaction(readonly=False, consistent_snapshot=False):
+    """Несколько запросов на одном соединении с одним COMMIT.
+
+    Отдаёт курсор; при исключении транзакция откатывается.
+    """
+    characteristics = []
+    if consistent_snapshot:
+        characteristics.append("WITH CONSISTENT SNAPSHOT")
+    if readonly:
+        characteristics.append("READ ONLY")
+
+    pool = await get_pool()
+    async with pool.acquire() as connection:
+        async with connection.cursor() as cursor:
+            await cursor.execute("START TRANSACTION " + ", ".join(characteristics))
+            try:
+                yield cursor
+                await connection.commit()
+            except BaseException:
+                await connection.rollback()
+                raise
+
+
+# Профили пользователей
+async def get_user_profile(user_id):
+    """Профиль пользователя через кэш (для неизвестного пользователя — пустой); None при ошибке БД"""
+    profile = profile_cache.get(user_id)
+    if profile is not None:
+        return profile
+    profiles = await _load_profiles([user_id])
+    return profiles[0] if profiles else None
+
+
+async def get_user_profiles(user_ids):
+    """Профили нескольких пользователей: {user_id: UserProfile}; промахи читаются одним запросом"""
+    result = {}
+    missing = []
+    for user_id in dict.fromkeys(user_ids):
+        profile = profile_cache.get(user_id)
+        if profile is not None:
+            result[user_id] = profile
+        else:
+            missing.append(user_id)
+    for profile in await _load_profiles(missing) or ():
+        result[profile.user_id] = profile
+    return result
+
+
+async def _load_profiles(user_ids):
+    if not user_ids:
+        return []
+    generation = profile_cache.generation
+    rows = await fetchall(
+        f"SELECT user_id, phone, banned FROM users "
+        f"WHERE user_id IN ({', '.join(['%s'] * len(user_ids))})",
+        user_ids
+    )
+    if rows is None:
+        return None
+    found = {row[0]: UserProfile(row[0], row[1], bool(row[2])) for row in rows}
+    profiles = [found.get(user_id) or UserProfile(user_id) for user_id in user_ids]
+    for profile in profiles:
+        profile_cache.put(profile, generation)
+    return profiles
+
+
+# Программа лояльности
+async def check_loyalty_reward(user_id):
+    """Проверить, достиг ли пользователь награды, и списать баллы одним запросом"""
+    query = "UPDATE users SET loyalty_points = 0 WHERE user_id = %s AND loyalty_points >= %s"
+    return await execute(query, (user_id, LOYALTY_FREE_TRIP - 1)) == 1
+
+
+async def complete_loyalty_trip(user_id):
+    """Учесть поездку: вернуть True, если она бесплатная (баллы сбрасываются), иначе начислить балл.
+
+    Один атомарный запрос: LAST_INSERT_ID(выражение) передаёт клиенту признак
+    награды в ответе на INSERT (для нового пользователя он 0), поэтому
+    одновременные поездки не получат награду дважды. None при ошибке БД.
+    """
+    query = """
+        INSERT INTO users (user_id, loyalty_points) VALUES (%s, 1)
+        ON DUPLICATE KEY UPDATE loyalty_points =
+            IF(LAST_INSERT_ID(loyalty_points >= %s), 0, loyalty_points + 1)
+    """
+    rewarded = await insert(query, (user_id, LOYALTY_FREE_TRIP - 1))
+    return None if rewarded is None else bool(rewarded)
+
+
+# Пользователи
+async def _set_banned(user_id, banned):
+    """Изменить флаг блокировки и версию списка блокировок одной транзакцией.
+
+    Возвращает новый номер версии или None при ошибке. Пользователь без строки
+    в users (ещё не копил баллы) создаётся, иначе блокировка бы не записалась.
+    """
+    try:
+        async with transaction() as cursor:
+            await cursor.execute(
+                "INSERT INTO users (user_id, banned) VALUES (%s, %s) "
+                "ON DUPLICATE KEY UPDATE banned = VALUES(banned)",
+                (user_id, banned)
+            )
+            # По версии другие процессы узнают, что список нужно перечитать
+            await cursor.execute("UPDATE ban_version SET version = version + 1 WHERE id = 1")
+            await cursor.execute("SELECT version FROM ban_version WHERE id = 1")
+            return (await cursor.fetchone())[0]
+    except Error as e:
+        print(f"Ошибка изменения блокировки: {e}")
+        return None
+    finally:
+        profile_cache.invalidate(user_id)
+
+
+async def ban_user(user_id):
+    """Заблокировать пользователя; вернуть новую версию списка блокировок или None"""
+    return await _set_banned(user_id, 1)
+
+
+async def unban_user(user_id):
+    """Разблокировать пользователя; вернуть новую версию списка блокировок или None"""
+    return await _set_banned(user_id, 0)
@@ -0,0 +1,119 @@
+"""Список заблокированных пользователей в памяти и отсев их обновлений.
+
+Обработчик reject_banned стоит в группе -1 и останавливает обработку
+обновления от заблокированного пользователя до остальных обработчиков и
+запросов к БД.
+"""
+import asyncio
+from array import array
+from bisect import bisect_left
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+from config import BAN_SYNC_INTERVAL
+from utils import is_admin
+import async_database as db
+
+
+class BannedUsers:
+    """Заблокированные пользователи в памяти: отсортированный массив ID (8 байт на ID).
+
+    Загружается при старте, обновляется при блокировке через этот процесс, а
+    изменения из других процессов подхватываются по номеру версии ban_version.
+    """
+
+    def __init__(self):
+        self._ids = array('q')
+        self.version = None
+        self._task = None
+
+    def __contains__(self, user_id):
+        index = bisect_left(self._ids, user_id)
+        return index < len(self._ids) and self._ids[index] == user_id
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, user_id):
+        index = bisect_left(self._ids, user_id)
+        if index == len(self._ids) or self._ids[index] != user_id:
+            self._ids.insert(index, user_id)
+
+    def discard(self, user_id):
+        index = bisect_left(self._ids, user_id)
+        if index < len(self._ids) and self._ids[index] == user_id:
+            del self._ids[index]
+
+    async def load(self):
+        """Загрузить список заблокированных из БД; False при ошибке"""
+        version = await db.fetchone("SELECT version FROM ban_version WHERE id = 1")
+        rows = await db.fetchall("SELECT user_id FROM users WHERE banned = 1 ORDER BY user_id")
+        if version is None or rows is None:
+            return False
+        self._ids = array('q', (row[0] for row in rows))
+        self.version = version[0]
+        return True
+
+    def applied(self, version):
+        """Учесть собственное изменение, получившее номер version.
+
+        Если до него список не менял никто другой, перечитывать его не нужно;
+        иначе версия не трогается и sync перечитает список.
+        """
+        if self.version is not None and version == self.version + 1:
+            self.version = version
+
+    async def sync(self):
+        """Перезагрузить список, если его изменил другой процесс"""
+        version = await db.fetchone("SELECT version FROM ban_version WHERE id = 1")
+        if version is not None and version[0] != self.version:
+            await self.load()
+
+    def start(self):
+        """Запустить периодическую сверку версии (один раз при старте бота)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(BAN_SYNC_INTERVAL)
+            await self.sync()
+
+
+banned_users = BannedUsers()
+
+
+async def ban(user_id):
+    """Заблокировать пользователя"""
+    version = await db.ban_user(user_id)
+    if version is None:
+        return False
+    banned_users.add(user_id)
+    banned_users.applied(version)
+    return True
+
+
+async def unban(user_id):
+    """Разблокировать пользователя"""
+    version = await db.unban_user(user_id)
+    if version is None:
+        return False
+    banned_users.discard(user_id)
+    banned_users.applied(version)
+    return True
+
+
+async def reject_banned(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отбросить обновление от заблокированного пользователя до остальных обработчиков"""
+    user = update.effective_user
+    if user is not None and user.id in banned_users and not is_admin(user.id):
+        raise ApplicationHandlerStop
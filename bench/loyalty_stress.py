@@ -0,0 +1,53 @@
+"""Нагрузочная проверка лояльности: ровно одна бесплатная поездка на каждые LOYALTY_FREE_TRIP.
+
+Поездки идут через журнал лояльности (loyalty.LoyaltyLedger.complete_trip) все
+одновременно. Запуск из корня проекта (нужна рабочая БД из config.DB_CONFIG):
+
+    python -m bench.loyalty_stress --users 20 --trips 600
+"""
+import argparse
+import asyncio
+import sys
+from collections import Counter
+
+import async_database as db
+from config import LOYALTY_FREE_TRIP
+from loyalty import LoyaltyLedger
+
+FIRST_USER_ID = 20_000_000
+TABLES = ('users', 'loyalty_events', 'loyalty_balances', 'loyalty_snapshots')
+
+
+async def cleanup(user_ids):
+    for table in TABLES:
+        await db.execute(f"DELETE FROM {table} WHERE user_id BETWEEN %s AND %s", (user_ids[0], user_ids[-1]))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--trips", type=int, default=600, help="одновременных поездок на пользователя")
+    args = parser.parse_args()
+
+    user_ids = range(FIRST_USER_ID, FIRST_USER_ID + args.users)
+    ledger = LoyaltyLedger()
+    try:
+        await cleanup(user_ids)
+        calls = [user_id for user_id in user_ids for _ in range(args.trips)]
+        results = await asyncio.gather(*(ledger.complete_trip(user_id) for user_id in calls))
+        await ledger.flush()
+        rewards = Counter(user_id for user_id, free in zip(calls, results) if free)
+
+        expected = args.trips // LOYALTY_FREE_TRIP
+        wrong = {user_id: rewards[user_id] for user_id in user_ids if rewards[user_id] != expected}
+        print(f"{len(calls)} поездок, наград {sum(rewards.values())}, ожидалось {expected * args.users}")
+        for user_id, count in wrong.items():
+            print(f"  пользователь {user_id}: {count} наград вместо {expected}")
+        await cleanup(user_ids)
+    finally:
+        await db.close_pool()
+    return 1 if wrong else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,104 @@
+"""Бенчмарк очереди напоминаний: память на запись, скорость вставки/отмены и точность срабатывания.
+
+БД не нужна — напоминания генерируются в памяти. Запуск из корня проекта:
+
+    python -m bench.reminder_bench --count 100000 --spread 10
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import tracemalloc
+
+from reminder_queue import Reminder, ReminderQueue, ReminderService
+
+
+def _fill(count, now):
+    queue = ReminderQueue()
+    for reminder_id in range(count):
+        queue.push(Reminder(now + random.uniform(0, 86400), reminder_id, 10_000_000 + reminder_id,
+                            reminder_id % 500, random.choice((24, 1))))
+    return queue
+
+
+def bench_queue(count):
+    now = time.time()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    queue = _fill(count, now)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    used = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del queue
+
+    # Время замеряем отдельно: tracemalloc замедляет выделение памяти
+    started = time.perf_counter()
+    queue = _fill(count, now)
+    push_time = time.perf_counter() - started
+
+    cancel_ids = random.sample(range(count), count // 10)
+    started = time.perf_counter()
+    for reminder_id in cancel_ids:
+        queue.cancel(reminder_id)
+    cancel_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    popped = len(queue.pop_due(now + 86400))
+    pop_time = time.perf_counter() - started
+
+    print(f"Напоминаний: {count}")
+    print(f"  память: {used / count:.0f} байт на напоминание ({used / 2 ** 20:.1f} МиБ всего)")
+    print(f"  вставка: {push_time / count * 1e6:.2f} мкс, отмена: {cancel_time / len(cancel_ids) * 1e6:.2f} мкс, "
+          f"извлечение: {pop_time / max(popped, 1) * 1e6:.2f} мкс")
+
+
+class _BenchService(ReminderService):
+    """Сервис без БД и Telegram: напоминания из списка, фиксируется опоздание срабатывания"""
+
+    def __init__(self, reminders, **kwargs):
+        super().__init__(**kwargs)
+        self.pending = reminders
+        self.lateness = []
+        self.done = asyncio.Event()
+        self.expected = len(reminders)
+
+    async def _fetch(self, start, until):
+        return [r for r in self.pending if (start is None or r.due >= start) and r.due < until]
+
+    async def _fire(self, reminders):
+        now = time.time()
+        self.lateness.extend(now - reminder.due for reminder in reminders)
+        if len(self.lateness) >= self.expected:
+            self.done.set()
+
+
+async def bench_jitter(count, spread):
+    start = time.time() + 1
+    reminders = [
+        Reminder(start + random.uniform(0, spread), reminder_id, reminder_id, 1, 1)
+        for reminder_id in range(count)
+    ]
+    service = _BenchService(reminders, window=max(spread * 2, 60))
+    service.start(bot=None)
+    await asyncio.wait_for(service.done.wait(), spread + 30)
+    await service.stop()
+
+    lateness = sorted(service.lateness)
+    print(f"Срабатывание {count} напоминаний за {spread} с:")
+    print(f"  опоздание p50 {statistics.median(lateness) * 1000:.2f} мс, "
+          f"p99 {lateness[int(len(lateness) * 0.99)] * 1000:.2f} мс, max {lateness[-1] * 1000:.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--spread", type=float, default=10, help="секунд, за которые срабатывают напоминания")
+    args = parser.parse_args()
+
+    bench_queue(args.count)
+    asyncio.run(bench_jitter(args.count, args.spread))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Нагрузочная проверка бронирования: одновременные запросы не продают больше MAX_SEATS.
+
+Запуск из корня проекта (нужна рабочая БД из config.DB_CONFIG):
+
+    python -m bench.seat_stress --requests 500 --rounds 20
+"""
+import argparse
+import asyncio
+import random
+import sys
+
+import async_database as db
+from booking import reserve_seats
+from config import MAX_SEATS
+
+
+async def run_round(requests):
+    trip_id = await _create_trip()
+    try:
+        seats = [random.randint(1, 2) for _ in range(requests)]
+        results = await asyncio.gather(*(
+            reserve_seats(trip_id, 10_000_000 + i, n) for i, n in enumerate(seats)
+        ))
+        granted = sum(n for n, remaining in zip(seats, results) if remaining is not None)
+        taken = await db.fetchone(
+            "SELECT COALESCE(SUM(seats), 0) FROM bookings WHERE trip_id = %s", (trip_id,)
+        )
+        counter = await db.fetchone("SELECT seats_taken FROM trips WHERE id = %s", (trip_id,))
+        return granted, int(taken[0]), counter[0]
+    finally:
+        await db.execute("DELETE FROM bookings WHERE trip_id = %s", (trip_id,))
+        await db.execute("DELETE FROM trips WHERE id = %s", (trip_id,))
+
+
+async def _create_trip():
+    async with db.transaction() as cursor:
+        await cursor.execute(
+            "INSERT INTO trips (trip_type, date) VALUES ('to_ufa', CURDATE() + INTERVAL 365 DAY)"
+        )
+        return cursor.lastrowid
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500, help="одновременных запросов на поездку")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    oversold = 0
+    try:
+        for number in range(1, args.rounds + 1):
+            granted, taken, counter = await run_round(args.requests)
+            status = "OK" if granted == taken == counter <= MAX_SEATS else "OVERSELL"
+            oversold += status != "OK"
+            print(f"Раунд {number}: выдано {granted}, в bookings {taken}, seats_taken {counter}, "
+                  f"лимит {MAX_SEATS} — {status}")
+    finally:
+        await db.close_pool()
+    return 1 if oversold else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,273 @@
+"""Бенчмарк приёма обновлений по настоящим путям PTB: getUpdates против webhook.
+
+Telegram заменяет поддельный Bot API на tornado в отдельном процессе, бот
+подключается к нему через base_url и ходит туда по HTTP, как к
+api.telegram.org. Обновления появляются на сервере пуассоновским потоком
+(--rate в секунду):
+
+* polling — Updater.start_polling (его запускает run_polling): бот забирает
+  обновления длинными запросами getUpdates;
+* webhook — Updater.start_webhook (его запускает run_webhook): сервер
+  отправляет каждое обновление POST-запросом с секретным заголовком на
+  локальный порт бота, не больше --max-connections запросов одновременно.
+
+Обработчик ждёт --work мс (запросы к БД) и делает --calls запросов sendMessage к
+тому же API. --latency — задержка сети в одну сторону между Telegram и ботом
+(по умолчанию 0: только локальный HTTP). Задержка в отчёте — от появления
+обновления на сервере до завершения обработчика, CPU бота — процессорное время
+процесса бота на обновление. Процесс «Telegram» делит ядра с ботом, поэтому на
+машине с одним-двумя ядрами предел пропускной способности занижен.
+
+С --users N обновления распределяются между N пользователями и обрабатываются
+UserSerialApplication (по очереди внутри пользователя). Нужен tornado
+(python-telegram-bot[webhooks]).
+Запуск из корня проекта:
+
+    python -m bench.update_bench --rate 100 --count 1000 --work 20 --concurrency 1 16 64
+    python -m bench.update_bench --users 50 --concurrency 16 --latency 40
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import socket
+import statistics
+import time
+
+import httpx
+from tornado.httpserver import HTTPServer
+from tornado.web import Application as WebApplication, RequestHandler
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+from processing import UserSerialApplication
+
+TOKEN = "123:bench"
+SECRET = "bench-secret"
+
+
+class FakeBotApi:
+    """Поддельный Bot API: getMe, setWebhook/deleteWebhook, getUpdates, sendMessage"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.updates = []  # появившиеся обновления; update_id = номер + 1
+        self.requests = {}  # метод -> число запросов
+        self.closed = False
+        self._appeared = asyncio.Event()
+
+    def publish(self, update):
+        self.updates.append(update)
+        self._appeared.set()
+
+    def close(self):
+        """Отпустить ждущие getUpdates перед остановкой"""
+        self.closed = True
+        self._appeared.set()
+
+    async def call(self, method, params):
+        self.requests[method] = self.requests.get(method, 0) + 1
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': "bench", 'username': "bench_bot"}
+        if method == 'getUpdates':
+            return await self._get_updates(params)
+        if method == 'sendMessage':
+            await asyncio.sleep(2 * self.latency)  # запрос и ответ
+            chat_id = int(params['chat_id'])
+            return {'message_id': self.requests[method], 'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'}, 'text': params['text']}
+        return True
+
+    async def _get_updates(self, params):
+        offset = int(params.get('offset', 0))
+        limit = int(params.get('limit', 100))
+        timeout = float(params.get('timeout', 0))
+        await asyncio.sleep(self.latency)  # запрос идёт до Telegram
+        deadline = time.monotonic() + timeout
+        while len(self.updates) < offset and time.monotonic() < deadline and not self.closed:
+            self._appeared.clear()
+            try:
+                await asyncio.wait_for(self._appeared.wait(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                pass
+        start = max(offset - 1, 0)
+        result = self.updates[start:start + limit]
+        await asyncio.sleep(self.latency)  # ответ идёт до бота
+        return result
+
+
+class _ApiHandler(RequestHandler):
+    def initialize(self, api):
+        self.api = api
+
+    async def post(self, method):
+        params = {name: self.get_body_argument(name) for name in self.request.body_arguments}
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps({'ok': True, 'result': await self.api.call(method, params)}))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _make_update(update_id, users):
+    user_id = update_id % users + 1 if users else update_id
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': "bench",
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': "bench"},
+        },
+    }
+
+
+def _arrivals(count, rate):
+    """Моменты появления обновлений (пуассоновский поток), секунды от начала"""
+    moment = 0.0
+    result = []
+    for _ in range(count):
+        moment += random.expovariate(rate)
+        result.append(moment)
+    return result
+
+
+async def _feed(api, arrivals, started, users, webhook_url, max_connections):
+    """Выпускать обновления в их моменты; для webhook — отправлять их боту"""
+    if webhook_url is None:
+        for number, moment in enumerate(arrivals):
+            await asyncio.sleep(max(started + moment - time.monotonic(), 0))
+            api.publish(_make_update(number + 1, users))
+        return
+
+    slots = asyncio.Semaphore(max_connections)
+    limits = httpx.Limits(max_connections=max_connections)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def deliver(number, moment):
+            await asyncio.sleep(max(started + moment - time.monotonic(), 0))
+            async with slots:
+                await asyncio.sleep(api.latency)
+                response = await client.post(webhook_url, json=_make_update(number + 1, users),
+                                             headers={'X-Telegram-Bot-Api-Secret-Token': SECRET})
+                response.raise_for_status()
+
+        await asyncio.gather(*(deliver(number, moment) for number, moment in enumerate(arrivals)))
+
+
+def _telegram(arrivals, args, api_port, webhook_url, control, results):
+    """Процесс «Telegram»: поддельный Bot API и выпуск обновлений"""
+    asyncio.run(_serve_telegram(arrivals, args, api_port, webhook_url, control, results))
+
+
+async def _serve_telegram(arrivals, args, api_port, webhook_url, control, results):
+    loop = asyncio.get_running_loop()
+    api = FakeBotApi(args.latency / 1000)
+    server = HTTPServer(WebApplication([(r"/bot[^/]+/(\w+)", _ApiHandler, {'api': api})]))
+    server.listen(api_port, '127.0.0.1')
+    results.put('ready')
+    started = await loop.run_in_executor(None, control.get)
+    await _feed(api, arrivals, started, args.users, webhook_url, args.max_connections)
+    await loop.run_in_executor(None, control.get)  # бот всё обработал
+    api.close()
+    results.put(api.requests)
+    await loop.run_in_executor(None, control.get)  # бот остановлен
+    server.stop()
+    await server.close_all_connections()
+
+
+async def run(mode, concurrency, arrivals, args, api_port, webhook_port, control, results):
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, results.get)  # API готов
+    latencies = []
+    done = asyncio.Event()
+    started = time.monotonic()
+    work = args.work / 1000
+
+    async def handle(update, context):
+        try:
+            await asyncio.sleep(work)
+            for _ in range(args.calls):
+                await context.bot.send_message(update.effective_chat.id, "ok")
+        finally:
+            latencies.append(time.monotonic() - started - arrivals[update.update_id - 1])
+            if len(latencies) == len(arrivals):
+                done.set()
+
+    builder = Application.builder().token(TOKEN).base_url(f"http://127.0.0.1:{api_port}/bot")
+    if args.users:
+        builder = (builder.application_class(UserSerialApplication, kwargs={'max_active': concurrency})
+                   .concurrent_updates(len(arrivals)))
+    else:
+        builder = builder.concurrent_updates(concurrency)
+    application = builder.build()
+    application.add_handler(TypeHandler(Update, handle))
+
+    async with application:
+        if mode == 'webhook':
+            await application.updater.start_webhook(
+                listen='127.0.0.1', port=webhook_port, url_path='telegram',
+                webhook_url=f"http://127.0.0.1:{webhook_port}/telegram",
+                secret_token=SECRET, max_connections=args.max_connections
+            )
+        else:
+            await application.updater.start_polling(poll_interval=0, timeout=10)
+        await application.start()
+
+        started = time.monotonic() + 0.1
+        control.put(started)
+        cpu_started = time.process_time()
+        await done.wait()
+        elapsed = time.monotonic() - started
+        cpu = time.process_time() - cpu_started
+        control.put(None)
+        requests = await loop.run_in_executor(None, results.get)
+
+        await application.updater.stop()
+        await application.stop()
+    control.put(None)
+
+    latencies.sort()
+    print(f"{mode:8} concurrent_updates={concurrency:<4} "
+          f"{len(arrivals) / elapsed:7.0f} обн./с  "
+          f"задержка p50 {statistics.median(latencies) * 1000:7.1f} мс, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:7.1f} мс, "
+          f"CPU бота {cpu / len(arrivals) * 1000:.2f} мс/обн., "
+          f"getUpdates {requests.get('getUpdates', 0)}, sendMessage {requests.get('sendMessage', 0)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк приёма и обработки обновлений")
+    parser.add_argument("--rate", type=float, default=300, help="обновлений в секунду")
+    parser.add_argument("--count", type=int, default=3000, help="всего обновлений")
+    parser.add_argument("--work", type=float, default=20, help="мс ожидания в обработчике")
+    parser.add_argument("--calls", type=int, default=1, help="запросов sendMessage на обновление")
+    parser.add_argument("--latency", type=float, default=0, help="мс сети в одну сторону до Telegram")
+    parser.add_argument("--max-connections", type=int, default=40, help="параллельных запросов webhook")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--users", type=int, default=0, help="пользователей (0 — без очередности по пользователю)")
+    args = parser.parse_args()
+
+    random.seed(1)
+    arrivals = _arrivals(args.count, args.rate)
+    for concurrency in args.concurrency:
+        for mode in ('polling', 'webhook'):
+            api_port, webhook_port = _free_port(), _free_port()
+            webhook_url = f"http://127.0.0.1:{webhook_port}/telegram" if mode == 'webhook' else None
+            control, results = multiprocessing.Queue(), multiprocessing.Queue()
+            telegram = multiprocessing.Process(
+                target=_telegram, args=(arrivals, args, api_port, webhook_url, control, results)
+            )
+            telegram.start()
+            try:
+                asyncio.run(run(mode, concurrency, arrivals, args, api_port, webhook_port, control, results))
+            finally:
+                telegram.join(10)
+                if telegram.is_alive():
+                    telegram.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+from aiomysql import Error
+from config import MAX_SEATS, PASSENGERS_PAGE_SIZE, REMINDER_BACKEND
+from reminder_queue import reminder_service
+from trips import schedule_cache, seats_left
+import async_database as db
+
+
+async def reserve_seats(trip_id, user_id, seats=1):
+    """Забронировать места на поездку.
+
+    Возвращает число оставшихся свободных мест или None, если мест не хватает
+    (или поездки нет). Счётчик trips.seats_taken увеличивается условным UPDATE,
+    который сам проверяет вместимость под блокировкой строки поездки, а бронь
+    вставляется в той же транзакции, поэтому одновременные запросы не могут
+    продать больше MAX_SEATS мест.
+    """
+    try:
+        async with db.transaction() as cursor:
+            await cursor.execute(
+                "UPDATE trips SET seats_taken = seats_taken + %s WHERE id = %s AND seats_taken + %s <= %s",
+                (seats, trip_id, seats, MAX_SEATS)
+            )
+            if cursor.rowcount != 1:
+                return None
+
+            await cursor.execute(
+                "INSERT INTO bookings (trip_id, user_id, seats) VALUES (%s, %s, %s)",
+                (trip_id, user_id, seats)
+            )
+            seats_taken = await _seats_taken(cursor, trip_id)
+    except Error as e:
+        print(f"Ошибка бронирования мест: {e}")
+        return None
+
+    schedule_cache.update_seats(trip_id, seats_taken)
+    if REMINDER_BACKEND == 'booking':
+        await reminder_service.add_for_booking(user_id, trip_id)
+    return seats_left(seats_taken)
+
+
+async def release_seats(trip_id, user_id):
+    """Отменить брони пользователя на поездку и вернуть число свободных мест"""
+    try:
+        async with db.transaction() as cursor:
+            # Сначала строка поездки — тот же порядок блокировок, что и в reserve_seats
+            await cursor.execute("SELECT id FROM trips WHERE id = %s FOR UPDATE", (trip_id,))
+            await cursor.execute(
+                "SELECT COALESCE(SUM(seats), 0) FROM bookings WHERE trip_id = %s AND user_id = %s",
+                (trip_id, user_id)
+            )
+            released = int((await cursor.fetchone())[0])
+            if released:
+                await cursor.execute(
+                    "DELETE FROM bookings WHERE trip_id = %s AND user_id = %s",
+                    (trip_id, user_id)
+                )
+                await cursor.execute(
+                    "UPDATE trips SET seats_taken = seats_taken - %s WHERE id = %s",
+                    (released, trip_id)
+                )
+            seats_taken = await _seats_taken(cursor, trip_id)
+    except Error as e:
+        print(f"Ошибка отмены бронирования: {e}")
+        return None
+
+    schedule_cache.update_seats(trip_id, seats_taken)
+    if REMINDER_BACKEND == 'booking':
+        await reminder_service.cancel_for_booking(user_id, trip_id)
+    return seats_left(seats_taken)
+
+
+async def get_trip_passengers(trip_id, cursor=0, backward=False, limit=PASSENGERS_PAGE_SIZE):
+    """Страница пассажиров поездки (keyset-пагинация по ID брони).
+
+    Возвращает (строки (booking_id, user_id, seats, phone), есть_раньше, есть_дальше)
+    или None при ошибке БД. ``cursor`` — ID крайней брони соседней страницы.
+    """
+    if not backward:
+        rows = await db.fetchall(
+            "SELECT id, user_id, seats FROM bookings "
+            "WHERE trip_id = %s AND id > %s ORDER BY id LIMIT %s",
+            (trip_id, cursor, limit + 1)
+        )
+    else:
+        rows = await db.fetchall(
+            "SELECT id, user_id, seats FROM bookings "
+            "WHERE trip_id = %s AND id < %s ORDER BY id DESC LIMIT %s",
+            (trip_id, cursor, limit + 1)
+        )
+    if rows is None:
+        return None
+
+    more = len(rows) > limit
+    rows = rows[:limit]
+    # Телефоны берём из кэша профилей, а не соединением с users
+    profiles = await db.get_user_profiles([row[1] for row in rows])
+    rows = [(booking_id, user_id, seats, profiles[user_id].phone if user_id in profiles else None)
+            for booking_id, user_id, seats in rows]
+    if backward:
+        rows.reverse()
+        return rows, more, True
+    return rows, cursor > 0, more
+
+
+async def _seats_taken(cursor, trip_id):
+    await cursor.execute("SELECT seats_taken FROM trips WHERE id = %s", (trip_id,))
+    row = await cursor.fetchone()
+    return row[0] if row else MAX_SEATS
@@ -1,10 +1,26 @@
 import logging
+import datetime
+import sys
+import tempfile
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
-from database import execute_query, increment_loyalty_points, check_loyalty_reward, ban_user, unban_user
-from scheduler import schedule_trip_reminder
-from config import BOT_TOKEN, TRIP_TYPES, MAX_SEATS, ADMIN_IDS
+from telegram.constants import FileSizeLimit, MessageLimit
+from telegram.ext import (Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler,
+                          TypeHandler, filters)
+import async_database as db
+from booking import reserve_seats, release_seats, get_trip_passengers
+from trips import schedule_cache, get_schedule_page, add_trip, remove_trip, schedule_missing_reminders
+from scheduler import start_scheduler, shutdown_scheduler
+from config import (BOT_TOKEN, BOT_MODE, WEBHOOK_CONFIG, CONCURRENT_UPDATES, UPDATE_BACKLOG,
+                    USER_MAX_PENDING, TRIP_TYPES, MAX_SEATS, ADMIN_IDS, REMINDER_BACKEND, LOYALTY_FREE_TRIP)
 from utils import is_admin, broadcast_message
+from broadcast import resume_broadcasts
+from reminder_queue import reminder_service
+from loyalty import ledger
+from bans import banned_users, ban, unban, reject_banned
+from financial_manager import financial_writer
+from export import FORMATS, export_filename, export_records
+from reports import parse_period, request_report, shutdown_executor
+from processing import UserSerialApplication
 
 # Настройка логирования
 logging.basicConfig(
@@ -45,19 +61,31 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+async def loyalty_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Условия программы лояльности и баланс пользователя"""
+    query = update.callback_query
+    balance = await ledger.get_balance(query.from_user.id)
+    await query.edit_message_text(
+        f"🎁 Каждая {LOYALTY_FREE_TRIP}-я поездка бесплатная.\n"
+        f"Ваши баллы: {balance} из {LOYALTY_FREE_TRIP - 1}.",
+        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Назад", callback_data='start')]])
+    )
+
+
 async def book_trip(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка запроса на бронирование"""
     query = update.callback_query
-    user_id = query.from_user.id
-    trip_type = query.data.split('_')[-1]  # Получаем направление ('to_ufa' или 'from_ufa')
+    cursor, backward = None, False
+    if query.data.startswith('trips_'):
+        # Листание: trips_<направление>_<n|p>_<дата>_<ID>
+        trip_type, direction, date, trip_id = query.data[len('trips_'):].rsplit('_', 3)
+        cursor, backward = (date, int(trip_id)), direction == 'p'
+    else:
+        trip_type = query.data[len('book_'):]  # Получаем направление ('to_ufa' или 'from_ufa')
 
-    trips = execute_query(
-        "SELECT id, date, passengers FROM trips WHERE trip_type = %s",
-        (trip_type,),
-        fetchall=True
-    )
+    page = await schedule_cache.get_page(trip_type, cursor, backward)
 
-    if not trips:
+    if not page or not page.trips:
         await query.edit_message_text(
             text="❌ Нет доступных поездок для этого направления.",
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Назад", callback_data='start')]])
@@ -65,34 +93,26 @@ async def book_trip(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Предложить выбор даты поездки
-    keyboard = [
-        [InlineKeyboardButton(f"Дата: {trip[1]} (ID: {trip[0]})",
-                              callback_data=f"confirm_booking_{trip_type}_{trip[0]}")]
-        for trip in trips
-    ]
-    keyboard.append([InlineKeyboardButton("Назад", callback_data='start')])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
     await query.edit_message_text(
         text="Выберите дату поездки:",
-        reply_markup=reply_markup
+        reply_markup=page.keyboard(trip_type)
     )
 
 
 async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Подтверждение бронирования места"""
     query = update.callback_query
-    data = query.data.split('_')
-    trip_type, trip_id = data[2], data[3]
+    trip_type, trip_id = query.data[len('confirm_booking_'):].rsplit('_', 1)
     user_id = query.from_user.id
 
     # Уведомить о бронировании нескольких мест
     context.user_data['trip_id'] = trip_id
     keyboard = [
+        [InlineKeyboardButton("Забронировать 1 место", callback_data='multi_booking_1')],
         [InlineKeyboardButton("Забронировать 2 места", callback_data='multi_booking_2')],
         [InlineKeyboardButton("Забронировать 3 места", callback_data='multi_booking_3')],
         [InlineKeyboardButton("Забронировать 4 места", callback_data='multi_booking_4')],
-        [InlineKeyboardButton("Отменить", callback_data='cancel_booking')],
+        [InlineKeyboardButton("Отменить", callback_data='abort_booking')],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text(
@@ -112,13 +132,26 @@ async def handle_multi_booking(update: Update, context: ContextTypes.DEFAULT_TYP
     num_seats = int(query.data.split('_')[-1])
     trip_id = context.user_data.get('trip_id')
 
+    # Одно место бронируется сразу
+    if num_seats == 1:
+        remaining = await reserve_seats(trip_id, user_id, 1)
+        if remaining is None:
+            await query.edit_message_text("❌ Свободных мест на эту поездку нет.")
+            return
+        await query.edit_message_text(
+            f"✅ Место забронировано. Осталось свободных мест: {remaining}.",
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Отменить бронь",
+                                                                     callback_data=f"cancel_booking_{trip_id}")]])
+        )
+        return
+
     # Уведомить админа
-    context.bot.send_message(
+    await context.bot.send_message(
         chat_id=admin_id,
         text=f"❗ Пользователь {user_id} запросил бронирование {num_seats} мест на поездку ID {trip_id}.",
         reply_markup=InlineKeyboardMarkup([
             [InlineKeyboardButton(f"Подтвердить {num_seats} места",
-                                  callback_data=f"admin_confirm_{trip_id}_{num_seats}")],
+                                  callback_data=f"admin_confirm_{trip_id}_{num_seats}_{user_id}")],
             [InlineKeyboardButton("Отменить", callback_data='admin_cancel_multi_booking')]
         ])
     )
@@ -126,58 +159,397 @@ async def handle_multi_booking(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.edit_message_text("Запрос на бронирование отправлен администратору.")
 
 
+async def abort_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отказ от запроса на бронирование (уже сделанные брони не трогаются)"""
+    query = update.callback_query
+    context.user_data.pop('trip_id', None)
+    await query.edit_message_text("Запрос отменён.")
+
+
+async def cancel_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отмена сделанной брони: cancel_booking_<ID поездки>"""
+    query = update.callback_query
+    trip_id = int(query.data[len('cancel_booking_'):])
+
+    if await release_seats(trip_id, query.from_user.id) is None:
+        await query.edit_message_text("❌ Не удалось отменить бронирование, попробуйте ещё раз.")
+        return
+    await query.edit_message_text("Бронирование отменено.")
+
+
 # Административные функции
-async def admin_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Управление расписанием"""
+async def admin_confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Подтверждение админом бронирования нескольких мест"""
     query = update.callback_query
-    trips = execute_query("SELECT id, trip_type, date FROM trips", fetchall=True)
-    if not trips:
-        await query.edit_message_text("Расписание пусто.")
+    if not is_admin(query.from_user.id):
         return
+    _, _, trip_id, num_seats, user_id = query.data.split('_')
+
+    remaining = await reserve_seats(trip_id, int(user_id), int(num_seats))
+    if remaining is None:
+        await query.edit_message_text(f"❌ На поездку ID {trip_id} не хватает мест для {num_seats} пассажиров.")
+        await context.bot.send_message(chat_id=int(user_id), text="❌ К сожалению, столько свободных мест нет.")
+        return
+
+    await query.edit_message_text(f"✅ Бронь на {num_seats} мест подтверждена. Осталось мест: {remaining}.")
+    await context.bot.send_message(chat_id=int(user_id), text=f"✅ Бронирование {num_seats} мест подтверждено.")
+
+
+async def _load_schedule_page(data, prefix):
+    """Страница расписания по данным кнопки: <prefix>_<n|p>_<дата>_<ID> или первая страница"""
+    if not data.startswith(prefix + '_'):
+        return await get_schedule_page()
+    direction, date, trip_id = data[len(prefix) + 1:].split('_')
+    return await get_schedule_page((date, int(trip_id)), backward=direction == 'p')
+
+
+# Первая страница списка поездок для префикса кнопок листания
+_SCHEDULE_FIRST_PAGE = {'schedule': 'admin_schedule', 'pick': 'admin_view_passengers'}
 
-    text = "📋 Текущее расписание:\n\n"
-    for trip_id, trip_type, date in trips:
-        text += f"ID {trip_id}: {TRIP_TYPES[trip_type]}, дата {date}\n"
 
-    keyboard = [[InlineKeyboardButton("Добавить поездку", callback_data='add_trip')],
-                [InlineKeyboardButton("Удалить поездку", callback_data='remove_trip')],
-                [InlineKeyboardButton("Назад", callback_data='start')]]
+def _schedule_navigation(prefix, trips, has_prev, has_next, paged):
+    """Кнопки листания расписания (пустой список, если листать некуда)"""
+    if not trips:
+        if paged:
+            # Поездки страницы удалили между просмотрами: начинаем с первой страницы
+            return [[InlineKeyboardButton("В начало", callback_data=_SCHEDULE_FIRST_PAGE[prefix])]]
+        if has_prev:
+            # Предстоящих нет: листаем назад от сегодня
+            cursor = f"{datetime.date.today()}_0"
+            return [[InlineKeyboardButton("◀️ Раньше", callback_data=f"{prefix}_p_{cursor}")]]
+        return []
+
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton(
+            "◀️ Раньше", callback_data=f"{prefix}_p_{trips[0][2]}_{trips[0][0]}"))
+    if has_next:
+        navigation.append(InlineKeyboardButton(
+            "Позже ▶️", callback_data=f"{prefix}_n_{trips[-1][2]}_{trips[-1][0]}"))
+    return [navigation] if navigation else []
+
+
+async def admin_schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Управление расписанием: admin_schedule или schedule_<n|p>_<дата>_<ID>"""
+    query = update.callback_query
+    if not is_admin(query.from_user.id):
+        return
+    page = await _load_schedule_page(query.data, 'schedule')
+    if page is None:
+        await query.edit_message_text("❌ Не удалось загрузить расписание.")
+        return
+    trips, has_prev, has_next = page
+    paged = query.data != 'admin_schedule'
+
+    if trips:
+        lines = ["📋 Расписание:", ""]
+        lines.extend(f"ID {trip_id}: {TRIP_TYPES.get(trip_type, trip_type)}, дата {date}, "
+                     f"занято {seats_taken}/{MAX_SEATS}"
+                     for trip_id, trip_type, date, seats_taken in trips)
+        text = "\n".join(lines)
+    elif paged:
+        text = "На этой странице больше нет поездок."
+    elif has_prev:
+        text = "Предстоящих поездок нет."
+    else:
+        text = "Расписание пусто."
+
+    keyboard = _schedule_navigation('schedule', trips, has_prev, has_next, paged)
+    keyboard += [[InlineKeyboardButton("Добавить поездку", callback_data='add_trip')],
+                 [InlineKeyboardButton("Удалить поездку", callback_data='remove_trip')],
+                 [InlineKeyboardButton("Назад", callback_data='start')]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text(text, reply_markup=reply_markup)
 
 
-async def admin_view_passengers(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Просмотр номеров телефонов пассажиров"""
+async def admin_trip_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Подсказка по командам изменения расписания"""
+    query = update.callback_query
+    await query.edit_message_text(
+        "Добавить поездку: /add_trip <to_ufa|from_ufa> <ГГГГ-ММ-ДД>\n"
+        "Удалить поездку: /remove_trip <ID>",
+        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Назад", callback_data='admin_schedule')]])
+    )
+
+
+async def admin_add_trip(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Добавление поездки: /add_trip <направление> <дата>"""
+    if not is_admin(update.message.from_user.id):
+        return
+    if len(context.args) != 2 or context.args[0] not in TRIP_TYPES:
+        await update.message.reply_text("Использование: /add_trip <to_ufa|from_ufa> <ГГГГ-ММ-ДД>")
+        return
+
+    trip_type, date = context.args
+    trip_id = await add_trip(trip_type, date)
+    if trip_id is None:
+        await update.message.reply_text("❌ Не удалось добавить поездку.")
+        return
+    await update.message.reply_text(f"✅ Поездка ID {trip_id} добавлена: {TRIP_TYPES[trip_type]}, {date}.")
+
+
+async def admin_remove_trip(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Удаление поездки: /remove_trip <ID>"""
+    if not is_admin(update.message.from_user.id):
+        return
+    if len(context.args) != 1 or not context.args[0].isdigit():
+        await update.message.reply_text("Использование: /remove_trip <ID>")
+        return
+
+    if await remove_trip(int(context.args[0])):
+        await update.message.reply_text("✅ Поездка удалена.")
+    else:
+        await update.message.reply_text("❌ Поездка не найдена или на неё есть брони.")
+
+
+async def admin_announcement(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Подсказка по рассылке объявления"""
+    query = update.callback_query
+    await query.edit_message_text(
+        "Чтобы разослать объявление всем пользователям, отправьте: /broadcast <текст>",
+        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Назад", callback_data='start')]])
+    )
+
+
+async def admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Рассылка объявления: /broadcast <текст>"""
+    if not is_admin(update.message.from_user.id):
+        return
+    text = update.message.text.partition(' ')[2].strip()
+    if not text:
+        await update.message.reply_text("Использование: /broadcast <текст>")
+        return
+
+    broadcast_id = await broadcast_message(context, text)
+    if broadcast_id is None:
+        await update.message.reply_text("❌ Не удалось запустить рассылку.")
+        return
+    await update.message.reply_text(f"📢 Рассылка #{broadcast_id} запущена.")
+
+
+async def admin_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выгрузка финансов: /export <с ГГГГ-ММ-ДД> <по ГГГГ-ММ-ДД, не включая> [csv|jsonl] [gz]"""
+    if not is_admin(update.message.from_user.id):
+        return
+    args = context.args
+    try:
+        start, end = datetime.date.fromisoformat(args[0]), datetime.date.fromisoformat(args[1])
+        fmt = args[2] if len(args) > 2 else 'csv'
+        compress = len(args) > 3 and args[3] == 'gz'
+        if fmt not in FORMATS or len(args) > 4 or (len(args) > 3 and not compress):
+            raise ValueError
+    except (IndexError, ValueError):
+        await update.message.reply_text("Использование: /export <ГГГГ-ММ-ДД> <ГГГГ-ММ-ДД> [csv|jsonl] [gz]")
+        return
+
+    with tempfile.TemporaryFile() as file:
+        try:
+            count = await export_records(file, start, end, fmt, compress)
+        except db.Error as e:
+            print(f"Ошибка выгрузки финансов: {e}")
+            await update.message.reply_text("❌ Не удалось выгрузить записи.")
+            return
+        if file.tell() > FileSizeLimit.FILESIZE_UPLOAD:
+            await update.message.reply_text("❌ Файл больше 50 МБ: сузьте период или добавьте gz.")
+            return
+        file.seek(0)
+        await update.message.reply_document(
+            document=file,
+            filename=export_filename(start, end, fmt, compress),
+            caption=f"📊 Записей: {count}"
+        )
+
+
+async def admin_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Финансовый отчёт: /report <ГГГГ-ММ | ГГГГ | с ГГГГ-ММ-ДД по ГГГГ-ММ-ДД>"""
+    if not is_admin(update.message.from_user.id):
+        return
+    period = parse_period(context.args)
+    if period is None:
+        await update.message.reply_text("Использование: /report <ГГГГ-ММ | ГГГГ | ГГГГ-ММ-ДД ГГГГ-ММ-ДД>")
+        return
+
+    request_report(context.bot, update.message.chat_id, *period)
+    await update.message.reply_text("⏳ Отчёт готовится, пришлю его сюда.")
+
+
+async def admin_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Подсказка по командам блокировки пользователей"""
     query = update.callback_query
-    passengers = execute_query(
-        "SELECT bookings.user_id, users.phone FROM bookings "
-        "JOIN users ON bookings.user_id = users.user_id", fetchall=True
+    await query.edit_message_text(
+        f"Заблокировано пользователей: {len(banned_users)}\n\n"
+        "Заблокировать: /ban <ID пользователя>\n"
+        "Разблокировать: /unban <ID пользователя>",
+        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Назад", callback_data='start')]])
     )
-    if not passengers:
+
+
+async def admin_ban(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Блокировка пользователя: /ban <ID>"""
+    if not is_admin(update.message.from_user.id):
+        return
+    if len(context.args) != 1 or not context.args[0].isdigit():
+        await update.message.reply_text("Использование: /ban <ID пользователя>")
+        return
+
+    if await ban(int(context.args[0])):
+        await update.message.reply_text("🔒 Пользователь заблокирован.")
+    else:
+        await update.message.reply_text("❌ Не удалось заблокировать пользователя.")
+
+
+async def admin_unban(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Разблокировка пользователя: /unban <ID>"""
+    if not is_admin(update.message.from_user.id):
+        return
+    if len(context.args) != 1 or not context.args[0].isdigit():
+        await update.message.reply_text("Использование: /unban <ID пользователя>")
+        return
+
+    if await unban(int(context.args[0])):
+        await update.message.reply_text("🔓 Пользователь разблокирован.")
+    else:
+        await update.message.reply_text("❌ Не удалось разблокировать пользователя.")
+
+
+async def admin_view_passengers(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Просмотр номеров телефонов пассажиров: выбор поездки (admin_view_passengers или pick_<n|p>_<дата>_<ID>)"""
+    query = update.callback_query
+    if not is_admin(query.from_user.id):
+        return
+    page = await _load_schedule_page(query.data, 'pick')
+    if page is None:
+        await query.edit_message_text("❌ Не удалось загрузить список поездок.")
+        return
+    trips, has_prev, has_next = page
+    paged = query.data != 'admin_view_passengers'
+    if not trips and not has_prev and not paged:
         await query.edit_message_text("Нет пассажиров для отображения.")
         return
 
-    text = "📞 Список пассажиров:\n\n"
-    for user_id, phone in passengers:
-        text += f"ID {user_id}: 📱 {phone}\n"
+    keyboard = [
+        [InlineKeyboardButton(f"ID {trip_id}: {TRIP_TYPES.get(trip_type, trip_type)}, {date}, занято {seats_taken}",
+                              callback_data=f"passengers_{trip_id}_n_0")]
+        for trip_id, trip_type, date, seats_taken in trips
+    ]
+    keyboard += _schedule_navigation('pick', trips, has_prev, has_next, paged)
+    keyboard.append([InlineKeyboardButton("Назад", callback_data='start')])
+    text = "📞 Выберите поездку:" if trips else "На этой странице больше нет поездок."
+    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
 
-    await query.edit_message_text(text)
+
+async def admin_trip_passengers(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Страница пассажиров поездки: passengers_<ID поездки>_<n|p>_<ID брони>"""
+    query = update.callback_query
+    if not is_admin(query.from_user.id):
+        return
+    trip_id, direction, cursor = query.data[len('passengers_'):].split('_')
+
+    page = await get_trip_passengers(int(trip_id), int(cursor), backward=direction == 'p')
+    if page is None:
+        await query.edit_message_text("❌ Не удалось загрузить список пассажиров.")
+        return
+    passengers, has_prev, has_next = page
+
+    navigation = []
+    if passengers:
+        if has_prev:
+            navigation.append(InlineKeyboardButton(
+                "◀️ Назад", callback_data=f"passengers_{trip_id}_p_{passengers[0][0]}"))
+        if has_next:
+            navigation.append(InlineKeyboardButton(
+                "Далее ▶️", callback_data=f"passengers_{trip_id}_n_{passengers[-1][0]}"))
+    elif int(cursor):
+        # Брони страницы отменили между просмотрами: начинаем список заново
+        navigation.append(InlineKeyboardButton("В начало", callback_data=f"passengers_{trip_id}_n_0"))
+    keyboard = [navigation] if navigation else []
+    keyboard.append([InlineKeyboardButton("К списку поездок", callback_data='admin_view_passengers')])
+
+    if passengers:
+        lines = [f"📞 Пассажиры поездки ID {trip_id}:", ""]
+        lines.extend(f"ID {user_id}: 📱 {phone or '—'}, мест: {seats}"
+                     for _, user_id, seats, phone in passengers)
+        text = "\n".join(lines)
+    elif int(cursor):
+        text = f"На этой странице поездки ID {trip_id} больше нет броней."
+    else:
+        text = f"На поездку ID {trip_id} нет броней."
+    await query.edit_message_text(text[:MessageLimit.MAX_TEXT_LENGTH], reply_markup=InlineKeyboardMarkup(keyboard))
 
 
 # Основной запуск
+async def post_init(application: Application):
+    """Подготовка при запуске бота"""
+    await banned_users.load()
+    banned_users.start()
+    start_scheduler(application.bot)
+    if REMINDER_BACKEND == 'booking':
+        reminder_service.start(application.bot)
+    else:
+        await schedule_missing_reminders()
+    await resume_broadcasts(application.bot)
+    ledger.start()
+    financial_writer.start()
+
+
+async def post_shutdown(application: Application):
+    """Освобождение ресурсов при остановке бота"""
+    await shutdown_scheduler()
+    await reminder_service.stop()
+    await ledger.stop()
+    await financial_writer.stop()
+    await banned_users.stop()
+    shutdown_executor()
+    await db.close_pool()
+
+
 def main():
     """Запуск бота"""
-    application = Application.builder().token(BOT_TOKEN).build()
+    if BOT_MODE == 'webhook' and not WEBHOOK_CONFIG['webhook_url']:
+        # Без публичного адреса PTB зарегистрировал бы в Telegram адрес локального сервера
+        print("Режим webhook требует WEBHOOK_URL (публичный адрес, включая путь)")
+        return 1
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .application_class(UserSerialApplication, kwargs={'max_active': CONCURRENT_UPDATES,
+                                                          'max_pending': USER_MAX_PENDING})
+        .concurrent_updates(UPDATE_BACKLOG)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
+    # Обновления заблокированных пользователей отсекаются до всех обработчиков
+    application.add_handler(TypeHandler(Update, reject_banned), group=-1)
     application.add_handler(CommandHandler("start", start))
-    application.add_handler(CallbackQueryHandler(book_trip, pattern='^book_to_ufa$|^book_from_ufa$'))
+    application.add_handler(CallbackQueryHandler(book_trip, pattern='^book_to_ufa$|^book_from_ufa$|^trips_.*'))
+    application.add_handler(CallbackQueryHandler(loyalty_info, pattern='^loyalty_info$'))
     application.add_handler(CallbackQueryHandler(confirm_booking, pattern='^confirm_booking_.*'))
     application.add_handler(CallbackQueryHandler(handle_multi_booking, pattern='^multi_booking_.*'))
-    application.add_handler(CallbackQueryHandler(admin_schedule, pattern='^admin_schedule$'))
-    application.add_handler(CallbackQueryHandler(admin_view_passengers, pattern='^admin_view_passengers$'))
-
-    application.run_polling()
+    application.add_handler(CallbackQueryHandler(abort_booking, pattern='^abort_booking$'))
+    application.add_handler(CallbackQueryHandler(cancel_booking, pattern='^cancel_booking_\\d+$'))
+    application.add_handler(CallbackQueryHandler(admin_confirm_booking, pattern='^admin_confirm_.*'))
+    application.add_handler(CallbackQueryHandler(admin_schedule, pattern='^admin_schedule$|^schedule_[np]_[\\d-]+_\\d+$'))
+    application.add_handler(CallbackQueryHandler(admin_trip_help, pattern='^add_trip$|^remove_trip$'))
+    application.add_handler(CommandHandler("add_trip", admin_add_trip))
+    application.add_handler(CommandHandler("remove_trip", admin_remove_trip))
+    application.add_handler(CallbackQueryHandler(admin_announcement, pattern='^admin_announcement$'))
+    application.add_handler(CommandHandler("broadcast", admin_broadcast))
+    application.add_handler(CommandHandler("export", admin_export))
+    application.add_handler(CommandHandler("report", admin_report))
+    application.add_handler(CallbackQueryHandler(admin_users, pattern='^admin_users$'))
+    application.add_handler(CommandHandler("ban", admin_ban))
+    application.add_handler(CommandHandler("unban", admin_unban))
+    application.add_handler(CallbackQueryHandler(admin_view_passengers, pattern='^admin_view_passengers$|^pick_[np]_[\\d-]+_\\d+$'))
+    application.add_handler(CallbackQueryHandler(admin_trip_passengers, pattern='^passengers_.*'))
+
+    if BOT_MODE == 'webhook':
+        # TLS завершает обратный прокси, сервер бота слушает локальный порт
+        application.run_webhook(**WEBHOOK_CONFIG)
+    else:
+        application.run_polling()
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
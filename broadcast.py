@@ -0,0 +1,121 @@
+import asyncio
+
+from aiomysql import Error
+from telegram.error import Forbidden, RetryAfter, TelegramError
+from config import BROADCAST_RATE, BROADCAST_CONCURRENCY, BROADCAST_CHUNK
+import async_database as db
+
+
+class RateLimiter:
+    """Равномерный лимит: не более ``rate`` отправок в секунду на весь процесс"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self._next = 0.0
+
+    async def wait(self):
+        """Дождаться своего слота"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, seconds):
+        """Остановить все отправки на ``seconds`` (ответ Telegram RetryAfter)"""
+        until = asyncio.get_running_loop().time() + seconds
+        self._next = max(self._next, until)
+
+
+# Общий лимит Telegram (~30 сообщений/с) на рассылки и напоминания
+telegram_limiter = RateLimiter(BROADCAST_RATE)
+
+_tasks = set()
+
+
+async def send_message(bot, chat_id, text, attempts=3):
+    """Отправить сообщение с учётом лимита; True, если доставлено"""
+    for _ in range(attempts):
+        await telegram_limiter.wait()
+        try:
+            await bot.send_message(chat_id=chat_id, text=text)
+            return True
+        except RetryAfter as e:
+            telegram_limiter.pause(e.retry_after)
+        except Forbidden:
+            return False  # Пользователь заблокировал бота
+        except TelegramError as e:
+            print(f"Ошибка отправки сообщения пользователю {chat_id}: {e}")
+            return False
+    return False
+
+
+async def send_many(bot, chat_ids, text, concurrency=BROADCAST_CONCURRENCY):
+    """Отправить сообщение нескольким получателям параллельно; вернуть (доставлено, ошибок)"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(chat_id):
+        async with semaphore:
+            return await send_message(bot, chat_id, text)
+
+    results = await asyncio.gather(*(send(chat_id) for chat_id in chat_ids))
+    sent = sum(results)
+    return sent, len(results) - sent
+
+
+async def run_broadcast(bot, broadcast_id, text, last_user_id=0):
+    """Разослать сообщение всем незаблокированным пользователям начиная после last_user_id.
+
+    Получатели читаются порциями по user_id, прогресс сохраняется после каждой
+    порции, поэтому прерванная рассылка продолжается с места остановки.
+    """
+    while True:
+        rows = await db.fetchall(
+            "SELECT user_id FROM users WHERE banned = 0 AND user_id > %s ORDER BY user_id LIMIT %s",
+            (last_user_id, BROADCAST_CHUNK)
+        )
+        if rows is None:
+            return  # Ошибка БД: рассылка останется незавершённой и продолжится позже
+        if not rows:
+            break
+
+        chat_ids = [row[0] for row in rows]
+        sent, failed = await send_many(bot, chat_ids, text)
+        last_user_id = chat_ids[-1]
+        await db.execute(
+            "UPDATE broadcasts SET last_user_id = %s, sent = sent + %s, failed = failed + %s WHERE id = %s",
+            (last_user_id, sent, failed, broadcast_id)
+        )
+
+    await db.execute("UPDATE broadcasts SET status = 'done' WHERE id = %s", (broadcast_id,))
+
+
+def _spawn(bot, broadcast_id, text, last_user_id=0):
+    task = asyncio.create_task(run_broadcast(bot, broadcast_id, text, last_user_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+async def start_broadcast(bot, text):
+    """Создать рассылку и запустить её в фоне; вернуть ID рассылки"""
+    try:
+        async with db.transaction() as cursor:
+            await cursor.execute("INSERT INTO broadcasts (text) VALUES (%s)", (text,))
+            broadcast_id = cursor.lastrowid
+    except Error as e:
+        print(f"Ошибка создания рассылки: {e}")
+        return None
+    _spawn(bot, broadcast_id, text)
+    return broadcast_id
+
+
+async def resume_broadcasts(bot):
+    """Продолжить незавершённые рассылки (при запуске бота)"""
+    rows = await db.fetchall(
+        "SELECT id, text, last_user_id FROM broadcasts WHERE status = 'running' ORDER BY id"
+    )
+    for broadcast_id, text, last_user_id in rows or ():
+        _spawn(bot, broadcast_id, text, last_user_id)
+    return len(rows or ())
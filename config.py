@@ -12,6 +12,14 @@ DB_CONFIG = {
     'database': 'taxi_bot_db'
 }
 
+# Пул соединений с БД
+DB_POOL_CONFIG = {
+    'size': int(os.getenv("DB_POOL_SIZE", 5)),                  # постоянные соединения
+    'max_overflow': int(os.getenv("DB_POOL_MAX_OVERFLOW", 10)),  # временные сверх size
+    'idle_timeout': int(os.getenv("DB_POOL_IDLE_TIMEOUT", 300)),  # сек. простоя до переоткрытия
+    'timeout': int(os.getenv("DB_POOL_TIMEOUT", 30)),            # сек. ожидания свободного соединения
+}
+
 TRIP_TYPES = {
     'to_ufa': 'В Уфу',
     'from_ufa': 'Из Уфы'
@@ -19,5 +27,81 @@ TRIP_TYPES = {
 
 MAX_SEATS = 4
 
+# Приём обновлений: 'polling' (getUpdates) или 'webhook' (HTTP-сервер за обратным прокси)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_CONFIG = {
+    'listen': os.getenv("WEBHOOK_LISTEN", "127.0.0.1"),     # адрес локального сервера
+    'port': int(os.getenv("WEBHOOK_PORT", 8443)),
+    'url_path': os.getenv("WEBHOOK_PATH", "telegram"),     # путь, который прокси передаёт боту
+    'webhook_url': os.getenv("WEBHOOK_URL"),               # публичный адрес, включая путь
+    'secret_token': os.getenv("WEBHOOK_SECRET"),           # проверка, что запрос от Telegram
+    'max_connections': int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 40)),  # параллельных запросов от Telegram
+}
+# Сколько обновлений обрабатывать одновременно (1 — по очереди); обновления одного
+# пользователя всегда идут по очереди. Запросы к БД сверх размера пула
+# (DB_POOL_CONFIG) ждут свободного соединения
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", 16))
+# Сколько обновлений брать из очереди сразу, включая ждущих очереди своего пользователя
+UPDATE_BACKLOG = int(os.getenv("UPDATE_BACKLOG", 1024))
+# Сколько обновлений одного пользователя может ждать его очереди; лишние
+# отбрасываются, чтобы один пользователь не занял весь UPDATE_BACKLOG
+USER_MAX_PENDING = int(os.getenv("USER_MAX_PENDING", 8))
+
+# Сколько секунд кэш расписания считается свежим без явного сброса
+SCHEDULE_CACHE_TTL = int(os.getenv("SCHEDULE_CACHE_TTL", 300))
+
+# Кэш профилей пользователей: не больше PROFILE_CACHE_SIZE записей, каждая свежа
+# PROFILE_CACHE_TTL секунд (если users меняет другой процесс)
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 10000))
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", 300))
+
+# Поездок на одной странице выбора даты
+TRIPS_PAGE_SIZE = 8
+
+# Поездок на странице расписания в админменю
+SCHEDULE_PAGE_SIZE = 20
+
+# Пассажиров на одной странице админки (≈70 символов на строку, лимит сообщения 4096)
+PASSENGERS_PAGE_SIZE = 40
+
+# Рассылки: отправок в секунду (лимит Telegram ~30), одновременных запросов,
+# получателей в порции между сохранениями прогресса
+BROADCAST_RATE = 25
+BROADCAST_CONCURRENCY = 8
+BROADCAST_CHUNK = 200
+
+# Напоминания: 'trip' — одна задача APScheduler на поездку за час до неё,
+# 'booking' — напоминания о каждой брони за REMINDER_OFFSETS часов (reminder_queue)
+REMINDER_BACKEND = os.getenv("REMINDER_BACKEND", "trip")
+REMINDER_OFFSETS = (24, 1)
+# Напоминания на сколько секунд вперёд держать в памяти (backend 'booking')
+REMINDER_WINDOW = 3600
+# Сколько секунд после пропущенного (бот был остановлен) напоминания его ещё стоит отправить
+REMINDER_MISFIRE_GRACE = 3600
+
+# Программа лояльности: каждая N-я поездка бесплатная
+LOYALTY_FREE_TRIP = 6
+# Журнал лояльности: записывать события пачками по LOYALTY_FLUSH_SIZE или раз в
+# LOYALTY_FLUSH_INTERVAL секунд, пересчитывать балансы раз в LOYALTY_REFRESH_INTERVAL секунд,
+# сворачивать события старше LOYALTY_RETENTION_DAYS дней
+LOYALTY_FLUSH_SIZE = 500
+LOYALTY_FLUSH_INTERVAL = 2
+LOYALTY_REFRESH_INTERVAL = 60
+LOYALTY_RETENTION_DAYS = 90
+
+# Финансовые операции пишутся пачками по FINANCE_BATCH_SIZE или раз в FINANCE_FLUSH_INTERVAL
+# секунд; в очереди не больше FINANCE_QUEUE_SIZE записей (дальше запись ждёт)
+FINANCE_BATCH_SIZE = 200
+FINANCE_FLUSH_INTERVAL = 1
+FINANCE_QUEUE_SIZE = 10000
+
+# Отчёты: процессов в пуле, строк в пачке и не больше REPORT_INFLIGHT пачек в обработке
+REPORT_WORKERS = 2
+REPORT_BATCH = 5000
+REPORT_INFLIGHT = 4
+
+# Как часто (секунд) сверять версию списка блокировок с БД (блокировки из других процессов)
+BAN_SYNC_INTERVAL = 10
+
 # Список админов (ID Telegram)
 ADMIN_IDS = [7117000356]
@@ -1,23 +1,153 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
 import mysql.connector
 from mysql.connector import Error
-from config import DB_CONFIG
+from config import DB_CONFIG, DB_POOL_CONFIG
+from profiles import profile_cache
 
 
-def get_connection():
-    """Установить соединение с базой данных"""
-    try:
-        connection = mysql.connector.connect(
+class PoolTimeout(Error):
+    """Нет свободного соединения в пуле"""
+
+
+class ConnectionPool:
+    """Пул соединений с БД на весь процесс.
+
+    Держит до ``size`` простаивающих соединений и открывает до ``max_overflow``
+    временных сверх них. Соединение, простоявшее дольше ``idle_timeout``,
+    переоткрывается, остальные проверяются ping-ом при выдаче.
+    """
+
+    def __init__(self, size=5, max_overflow=10, idle_timeout=300, timeout=30):
+        self.size = size
+        self.max_overflow = max_overflow
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = deque()  # (соединение, время возврата в пул)
+        self._opened = 0
+        self._available = threading.Condition(threading.Lock())
+
+    def _connect(self):
+        return mysql.connector.connect(
             host=DB_CONFIG['host'],
             user=DB_CONFIG['user'],
             password=DB_CONFIG['password'],
-            database=DB_CONFIG['database']
+            database=DB_CONFIG['database'],
+            # Одиночные запросы фиксируются сервером сами, без отдельного COMMIT;
+            # несколько запросов группируются через transaction()
+            autocommit=True
         )
-        return connection
+
+    def acquire(self):
+        """Взять соединение из пула (или открыть новое, если есть лимит)"""
+        deadline = time.monotonic() + self.timeout
+        connection = None
+        with self._available:
+            while True:
+                if self._idle:
+                    connection, released_at = self._idle.pop()
+                    break
+                if self._opened < self.size + self.max_overflow:
+                    self._opened += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout("Истекло время ожидания соединения из пула")
+                self._available.wait(remaining)
+
+        if connection is not None:
+            if time.monotonic() - released_at <= self.idle_timeout:
+                try:
+                    connection.ping(reconnect=False)
+                    return connection
+                except Error:
+                    pass
+            self._close(connection)
+
+        try:
+            return self._connect()
+        except Error:
+            self._discard()
+            raise
+
+    def release(self, connection):
+        """Вернуть соединение в пул"""
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except Error:
+            self._close(connection)
+            self._discard()
+            return
+
+        with self._available:
+            if len(self._idle) < self.size:
+                self._idle.append((connection, time.monotonic()))
+                self._available.notify()
+                return
+        # Временное соединение сверх size закрываем сразу
+        self._close(connection)
+        self._discard()
+
+    def close(self):
+        """Закрыть все простаивающие соединения"""
+        with self._available:
+            idle, self._idle = self._idle, deque()
+            self._opened -= len(idle)
+            self._available.notify_all()
+        for connection, _ in idle:
+            self._close(connection)
+
+    def _discard(self):
+        with self._available:
+            self._opened -= 1
+            self._available.notify()
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Error:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Пул соединений процесса (создаётся при первом обращении)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(**DB_POOL_CONFIG)
+    return _pool
+
+
+def close_pool():
+    """Закрыть пул соединений (при остановке бота)"""
+    if _pool is not None:
+        _pool.close()
+
+
+def get_connection():
+    """Получить соединение с базой данных из пула"""
+    try:
+        return get_pool().acquire()
     except Error as e:
         print(f"Ошибка подключения к базе данных: {e}")
         return None
 
 
+def release_connection(connection):
+    """Вернуть соединение в пул"""
+    get_pool().release(connection)
+
+
 def execute_query(query, params=(), fetchone=False, fetchall=False):
     """Выполнение SQL-запроса"""
     connection = get_connection()
@@ -25,9 +155,9 @@ def execute_query(query, params=(), fetchone=False, fetchall=False):
         return None
 
     try:
-        cursor = connection.cursor()
+        # Буферизованный курсор: соединение возвращается в пул без непрочитанных строк
+        cursor = connection.cursor(buffered=True)
         cursor.execute(query, params)
-        connection.commit()
 
         if fetchone:
             result = cursor.fetchone()
@@ -37,48 +167,68 @@ def execute_query(query, params=(), fetchone=False, fetchall=False):
             result = None
 
         cursor.close()
-        connection.close()
         return result
     except Error as e:
         print(f"Ошибка выполнения запроса: {e}")
         return None
+    finally:
+        release_connection(connection)
 
 
-# Программа лояльности
-def increment_loyalty_points(user_id):
-    """Увеличить баллы лояльности пользователя"""
-    query = """
-        INSERT INTO users (user_id, loyalty_points) VALUES (%s, 1)
-        ON DUPLICATE KEY UPDATE loyalty_points = loyalty_points + 1
-    """
-    execute_query(query, (user_id,))
-
+@contextmanager
+def transaction(readonly=False, consistent_snapshot=False):
+    """Несколько запросов на одном соединении с одним COMMIT.
 
-def check_loyalty_reward(user_id):
-    """Проверить, достиг ли пользователь награды"""
-    query = "SELECT loyalty_points FROM users WHERE user_id = %s"
-    points = execute_query(query, (user_id,), fetchone=True)
+    Отдаёт курсор; при исключении транзакция откатывается. Для согласованного
+    чтения нескольких таблиц: ``transaction(readonly=True, consistent_snapshot=True)``.
+    """
+    connection = get_pool().acquire()
+    try:
+        connection.start_transaction(consistent_snapshot=consistent_snapshot,
+                                     readonly=readonly or None)
+        cursor = connection.cursor(buffered=True)
+        try:
+            yield cursor
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+    finally:
+        release_connection(connection)
 
-    if points and points[0] >= 5:  # Каждая 6-я поездка — бесплатная
-        reset_loyalty_points(user_id)
-        return True
-    return False
 
+# Пользователи
+def _set_banned(user_id, banned):
+    """Изменить флаг блокировки и версию списка блокировок одной транзакцией.
 
-def reset_loyalty_points(user_id):
-    """Сбросить баллы лояльности после награды"""
-    query = "UPDATE users SET loyalty_points = 0 WHERE user_id = %s"
-    execute_query(query, (user_id,))
+    Возвращает новый номер версии или None при ошибке. Пользователь без строки
+    в users (ещё не копил баллы) создаётся, иначе блокировка бы не записалась.
+    """
+    try:
+        with transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO users (user_id, banned) VALUES (%s, %s) "
+                "ON DUPLICATE KEY UPDATE banned = VALUES(banned)",
+                (user_id, banned)
+            )
+            # По версии другие процессы узнают, что список нужно перечитать
+            cursor.execute("UPDATE ban_version SET version = version + 1 WHERE id = 1")
+            cursor.execute("SELECT version FROM ban_version WHERE id = 1")
+            return cursor.fetchone()[0]
+    except Error as e:
+        print(f"Ошибка изменения блокировки: {e}")
+        return None
+    finally:
+        profile_cache.invalidate(user_id)
 
 
-# Пользователи
 def ban_user(user_id):
-    """Заблокировать пользователя"""
-    query = "UPDATE users SET banned = 1 WHERE user_id = %s"
-    execute_query(query, (user_id,))
+    """Заблокировать пользователя; вернуть новую версию списка блокировок или None"""
+    return _set_banned(user_id, 1)
 
 
 def unban_user(user_id):
-    """Разблокировать пользователя"""
-    query = "UPDATE users SET banned = 0 WHERE user_id = %s"
-    execute_query(query, (user_id,))
+    """Разблокировать пользователя; вернуть новую версию списка блокировок или None"""
+    return _set_banned(user_id, 0)
@@ -0,0 +1,91 @@
+"""Выгрузка financial_records за период в CSV или JSONL (можно со сжатием gzip).
+
+Записи читаются серверным курсором пачками и сразу пишутся в файл, поэтому
+память не зависит от размера выгрузки. Запуск из консоли:
+
+    python export.py 2024-01-01 2025-01-01 --format jsonl --gzip -o finance.jsonl.gz
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import sys
+from datetime import date
+
+import async_database as db
+
+FORMATS = ('csv', 'jsonl')
+COLUMNS = ('id', 'date', 'amount', 'trip_type', 'discount_applied', 'bonus_points_used')
+
+
+def export_filename(start, end, fmt, compress=False):
+    """Имя файла выгрузки: finance_<начало>_<конец>.<формат>[.gz]"""
+    return f"finance_{start}_{end}.{fmt}" + (".gz" if compress else "")
+
+
+async def export_records(file, start, end, fmt='csv', compress=False):
+    """Записать операции за даты [start, end) в двоичный файл file; вернуть число записей"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+
+    binary = gzip.GzipFile(fileobj=file, mode='wb') if compress else file
+    text = io.TextIOWrapper(binary, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    if fmt == 'csv':
+        writer.writerow(COLUMNS)
+
+    count = 0
+    try:
+        async for rows in db.stream(
+            f"SELECT {', '.join(COLUMNS)} FROM financial_records "
+            "WHERE date >= %s AND date < %s ORDER BY date, id",
+            (start, end)
+        ):
+            for record_id, day, amount, trip_type, discount, bonus_points in rows:
+                if fmt == 'csv':
+                    writer.writerow((record_id, day, amount, trip_type, discount, bonus_points))
+                else:
+                    text.write(json.dumps({
+                        'id': record_id, 'date': day.isoformat(), 'amount': str(amount),
+                        'trip_type': trip_type, 'discount_applied': str(discount),
+                        'bonus_points_used': bonus_points,
+                    }, ensure_ascii=False) + "\n")
+            count += len(rows)
+            # Отдаём цикл событий обработчикам бота между пачками
+            await asyncio.sleep(0)
+    finally:
+        # Закрываем обёртки, не закрывая сам файл
+        text.flush()
+        text.detach()
+        if compress:
+            binary.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python export.py", description="Выгрузка финансовых операций")
+    parser.add_argument("start", type=date.fromisoformat, help="первый день (ГГГГ-ММ-ДД)")
+    parser.add_argument("end", type=date.fromisoformat, help="день после последнего (ГГГГ-ММ-ДД)")
+    parser.add_argument("--format", choices=FORMATS, default='csv', help="формат файла")
+    parser.add_argument("--gzip", action="store_true", help="сжать gzip")
+    parser.add_argument("-o", "--output", default=None, help="файл (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    async def run():
+        try:
+            if args.output is None:
+                return await export_records(sys.stdout.buffer, args.start, args.end, args.format, args.gzip)
+            with open(args.output, 'wb') as file:
+                return await export_records(file, args.start, args.end, args.format, args.gzip)
+        finally:
+            await db.close_pool()
+
+    count = asyncio.run(run())
+    print(f"Выгружено записей: {count}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,10 @@
-from datetime import datetime
+import asyncio
+from datetime import date, datetime, timedelta
 from dataclasses import dataclass
-from typing import List, Dict
-import aiomysql
-from db import get_db_connection
+from typing import List, Dict, Optional, Tuple
+from aiomysql import Error
+from config import FINANCE_BATCH_SIZE, FINANCE_FLUSH_INTERVAL, FINANCE_QUEUE_SIZE
+import async_database as db
 
 
 @dataclass
@@ -14,30 +16,283 @@ class FinancialRecord:
     bonus_points_used: int = 0
 
 
+@dataclass
+class ProfitStats:
+    start: date
+    total: float
+    records: int
+
+    @property
+    def average(self) -> float:
+        return self.total / self.records if self.records else 0.0
+
+
+# Начало корзины для дня даты day: сам день, понедельник недели, первое число месяца
+_BUCKETS = {
+    'day': "day",
+    'week': "DATE_SUB(day, INTERVAL WEEKDAY(day) DAY)",
+    'month': "DATE_SUB(day, INTERVAL DAYOFMONTH(day) - 1 DAY)",
+}
+_PERIODS = ('day', 'week', 'month')
+
+
+def period_range(period: str, today: Optional[date] = None) -> Tuple[date, date]:
+    """Полуоткрытый диапазон дат [начало, конец) текущего дня, недели (с понедельника) или месяца"""
+    today = today or date.today()
+    if period == 'day':
+        return today, today + timedelta(days=1)
+    if period == 'week':
+        start = today - timedelta(days=today.weekday())
+        return start, start + timedelta(days=7)
+    start = today.replace(day=1)
+    return start, (start + timedelta(days=32)).replace(day=1)
+
+
+async def write_records(cursor, records: List[FinancialRecord]):
+    """Записать операции одним многострочным INSERT и добавить их к дневным итогам"""
+    await cursor.executemany(
+        """
+        INSERT INTO financial_records (date, amount, trip_type, discount_applied, bonus_points_used)
+        VALUES (%s, %s, %s, %s, %s)
+        """,
+        [(r.date, r.amount, r.trip_type, r.discount_applied, r.bonus_points_used) for r in records]
+    )
+    rollups = {}
+    for r in records:
+        total, count, discounts, bonus_points = rollups.get((r.date, r.trip_type), (0, 0, 0, 0))
+        rollups[(r.date, r.trip_type)] = (total + r.amount, count + 1, discounts + r.discount_applied,
+                                         bonus_points + r.bonus_points_used)
+    # Строки итогов блокируются в одном порядке, чтобы параллельные пачки не взаимоблокировались
+    await cursor.executemany(
+        """
+        INSERT INTO financial_daily (day, trip_type, total, records, discounts, bonus_points)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE total = total + VALUES(total), records = records + VALUES(records),
+            discounts = discounts + VALUES(discounts), bonus_points = bonus_points + VALUES(bonus_points)
+        """,
+        [key + value for key, value in sorted(rollups.items(), key=lambda item: (str(item[0][0]), item[0][1]))]
+    )
+
+
 class FinancialManager:
-    async def add_trip_record(self, record: FinancialRecord):
-        connection = await get_db_connection()
-        async with connection.cursor() as cursor:
-            await cursor.execute(
-                """
-                INSERT INTO financial_records (date, amount, trip_type, discount_applied, bonus_points_used)
-                VALUES (%s, %s, %s, %s, %s)
-                """,
-                (record.date, record.amount, record.trip_type, record.discount_applied, record.bonus_points_used)
-            )
-        connection.close()
+    """Финансовые записи о поездках и отчёты по дневным итогам financial_daily.
+
+    Запросы идут через общий пул соединений async_database. Каждая запись в
+    том же коммите добавляется к итогу своего дня и направления, поэтому отчёт
+    за период читает по строке на день, а не все записи. Диапазоны дат
+    полуоткрытые и сравниваются с ключом как есть, без функций над столбцом,
+    чтобы работал индекс.
+    """
+
+    def __init__(self, writer: Optional['FinancialWriter'] = None):
+        self.writer = writer if writer is not None else financial_writer
+
+    async def add_trip_record(self, record: FinancialRecord) -> bool:
+        """Записать операцию: через очередь writer, пока он запущен, иначе сразу"""
+        if self.writer.running:
+            await self.writer.add(record)
+            return True
+        try:
+            async with db.transaction() as cursor:
+                await write_records(cursor, [record])
+            return True
+        except Error as e:
+            print(f"Ошибка записи финансовой операции: {e}")
+            return False
 
     async def get_average_profit(self, period: str) -> float:
-        connection = await get_db_connection()
-        async with connection.cursor() as cursor:
-            if period == 'day':
-                query = "SELECT AVG(amount) FROM financial_records WHERE date = CURDATE()"
-            elif period == 'week':
-                query = "SELECT AVG(amount) FROM financial_records WHERE WEEK(date) = WEEK(CURDATE())"
-            else:
-                query = "SELECT AVG(amount) FROM financial_records WHERE MONTH(date) = MONTH(CURDATE())"
-
-            await cursor.execute(query)
-            result = await cursor.fetchone()
-        connection.close()
-        return result[0] if result else 0.0
+        """Средняя сумма поездки за текущий день, неделю ('week') или месяц"""
+        start, end = period_range(period)
+        return await self.get_average_profit_range(start, end)
+
+    async def get_average_profit_range(self, start: date, end: date, trip_type: Optional[str] = None) -> float:
+        """Средняя сумма поездки за даты [start, end), по направлению или по всем"""
+        query = "SELECT SUM(total), SUM(records) FROM financial_daily WHERE day >= %s AND day < %s"
+        params = [start, end]
+        if trip_type is not None:
+            query += " AND trip_type = %s"
+            params.append(trip_type)
+
+        row = await db.fetchone(query, params)
+        if not row or not row[1]:
+            return 0.0
+        total, records = row
+        return float(total) / records
+
+    async def get_profit_series(self, start: date, end: date, granularity: str = 'day',
+                                trip_type: Optional[str] = None) -> Optional[List[ProfitStats]]:
+        """Выручка за даты [start, end) по дням, неделям или месяцам одним запросом.
+
+        Возвращает только корзины, в которых есть записи, по возрастанию даты;
+        None при ошибке БД.
+        """
+        if granularity not in _BUCKETS:
+            raise ValueError(f"Неизвестная детализация: {granularity}")
+        bucket = _BUCKETS[granularity]
+        query = (
+            f"SELECT {bucket} AS bucket, SUM(total), SUM(records) FROM financial_daily "
+            "WHERE day >= %s AND day < %s"
+        )
+        params = [start, end]
+        if trip_type is not None:
+            query += " AND trip_type = %s"
+            params.append(trip_type)
+        query += " GROUP BY bucket ORDER BY bucket"
+
+        rows = await db.fetchall(query, params)
+        if rows is None:
+            return None
+        return [ProfitStats(bucket_start, float(total), int(records)) for bucket_start, total, records in rows]
+
+    async def get_profit_summary(self, trip_type: Optional[str] = None) -> Optional[Dict[str, ProfitStats]]:
+        """Выручка за сегодня, текущую неделю и текущий месяц одним запросом"""
+        ranges = {period: period_range(period) for period in _PERIODS}
+        columns = []
+        params = []
+        for period in _PERIODS:
+            columns.append("SUM(IF(day >= %s AND day < %s, total, 0)), SUM(IF(day >= %s AND day < %s, records, 0))")
+            params.extend(ranges[period] * 2)
+        # Одно сканирование по диапазону, который покрывает все три периода
+        query = f"SELECT {', '.join(columns)} FROM financial_daily WHERE day >= %s AND day < %s"
+        params.extend((min(start for start, _ in ranges.values()), max(end for _, end in ranges.values())))
+        if trip_type is not None:
+            query += " AND trip_type = %s"
+            params.append(trip_type)
+
+        row = await db.fetchone(query, params)
+        if row is None:
+            return None
+        summary = {}
+        for index, period in enumerate(_PERIODS):
+            total, records = row[2 * index], row[2 * index + 1]
+            summary[period] = ProfitStats(ranges[period][0], float(total or 0), int(records or 0))
+        return summary
+
+
+class FinancialWriter:
+    """Отложенная запись операций пачками.
+
+    add ставит запись в очередь и сразу возвращается; фоновая задача пишет
+    накопленное одним INSERT, когда набралось batch_size записей или прошло
+    flush_interval секунд с первой записи пачки. Очередь ограничена
+    queue_size: если БД не успевает, add ждёт свободного места. Пачка,
+    которую не удалось записать, повторяется, новые записи при этом не берутся.
+    """
+
+    def __init__(self, batch_size=FINANCE_BATCH_SIZE, flush_interval=FINANCE_FLUSH_INTERVAL,
+                 queue_size=FINANCE_QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.written = 0
+        self.batches = 0
+        self._queue = None
+        self._pending = []
+        self._task = None
+        self._stopping = None
+
+    @property
+    def running(self):
+        """Идёт ли фоновая запись (между start и stop)"""
+        return self._task is not None
+
+    async def add(self, record: FinancialRecord):
+        """Поставить операцию в очередь записи"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.queue_size)
+        await self._queue.put(record)
+
+    def start(self):
+        """Запустить фоновую запись (один раз при старте бота)"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.queue_size)
+        if self._task is None:
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить фоновую запись и записать всё, что осталось в очереди.
+
+        Фоновая задача не отменяется, а доходит до конца текущей пачки: отмена
+        после COMMIT на сервере оставила бы пачку в _pending, и она записалась
+        бы второй раз.
+        """
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        while self._pending or (self._queue is not None and not self._queue.empty()):
+            if self._queue is not None:
+                self._take(self.batch_size)
+            if not await self.flush():
+                stats = self.stats()
+                print(f"Не записано финансовых операций: {stats['pending'] + stats['queued']}")
+                break
+
+    async def flush(self):
+        """Записать текущую пачку; False при ошибке БД (пачка останется для повтора)"""
+        if not self._pending:
+            return True
+        batch = self._pending
+        try:
+            async with db.transaction() as cursor:
+                await write_records(cursor, batch)
+        except Error as e:
+            print(f"Ошибка записи финансовых операций: {e}")
+            return False
+        self._pending = []
+        self.written += len(batch)
+        self.batches += 1
+        return True
+
+    def stats(self):
+        """Состояние очереди для мониторинга"""
+        return {
+            'queued': self._queue.qsize() if self._queue else 0,
+            'pending': len(self._pending),
+            'written': self.written,
+            'batches': self.batches,
+        }
+
+    def _take(self, limit):
+        while len(self._pending) < limit and not self._queue.empty():
+            self._pending.append(self._queue.get_nowait())
+
+    async def _get(self, timeout=None):
+        """Следующая запись из очереди; None по таймауту или при остановке"""
+        get = asyncio.ensure_future(self._queue.get())
+        stopping = asyncio.ensure_future(self._stopping.wait())
+        await asyncio.wait((get, stopping), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        stopping.cancel()
+        if get.done():
+            return get.result()
+        get.cancel()  # Запись остаётся в очереди
+        return None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._stopping.is_set():
+            if not self._pending:
+                record = await self._get()
+                if record is None:
+                    continue
+                self._pending.append(record)
+            deadline = loop.time() + self.flush_interval
+            while len(self._pending) < self.batch_size and not self._stopping.is_set():
+                self._take(self.batch_size)
+                timeout = deadline - loop.time()
+                if len(self._pending) >= self.batch_size or timeout <= 0:
+                    break
+                record = await self._get(timeout)
+                if record is None:
+                    break
+                self._pending.append(record)
+            if not await self.flush():
+                # БД недоступна, повторим ту же пачку (или её допишет stop)
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+
+financial_writer = FinancialWriter()
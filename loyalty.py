@@ -0,0 +1,194 @@
+"""Журнал программы лояльности.
+
+Баллы и бесплатная поездка решаются счётчиком users.loyalty_points — одним
+атомарным запросом на поездку (async_database.complete_loyalty_trip), без
+задержки и двойных наград. Журнал хранит историю: каждая поездка — строка в
+loyalty_events (только добавление, пачками), итоги пользователя (поездок,
+наград) — строка loyalty_balances, которую дополняет фоновый пересчёт по
+новым событиям. Старые события сворачиваются в loyalty_snapshots и удаляются.
+"""
+import asyncio
+
+from aiomysql import Error
+from config import (LOYALTY_FREE_TRIP, LOYALTY_FLUSH_SIZE, LOYALTY_FLUSH_INTERVAL,
+                    LOYALTY_REFRESH_INTERVAL, LOYALTY_RETENTION_DAYS)
+import async_database as db
+
+# Баллов для бесплатной поездки: каждая LOYALTY_FREE_TRIP-я поездка бесплатная
+REWARD_POINTS = LOYALTY_FREE_TRIP - 1
+# Событий за одну транзакцию пересчёта и сжатия
+FOLD_BATCH = 5000
+
+
+def _totals(rows):
+    """Итоги событий (id, user_id, kind) по пользователю: [поездок, наград, последний ID]"""
+    totals = {}
+    for event_id, user_id, kind in rows:
+        item = totals.setdefault(user_id, [0, 0, 0])
+        item[0 if kind == 'trip' else 1] += 1
+        item[2] = max(item[2], event_id)
+    return totals
+
+
+class LoyaltyLedger:
+    """Учёт поездок по счётчику и буферизованная запись истории лояльности"""
+
+    def __init__(self, flush_size=LOYALTY_FLUSH_SIZE, flush_interval=LOYALTY_FLUSH_INTERVAL,
+                 refresh_interval=LOYALTY_REFRESH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        self._buffer = []
+        self._flush_lock = None
+        self._task = None
+        self._stopping = None
+
+    async def record_event(self, user_id, free):
+        """Добавить в историю поездку или награду (запишется пачкой)"""
+        self._buffer.append((user_id, -REWARD_POINTS, 'reward') if free else (user_id, 1, 'trip'))
+        if len(self._buffer) >= self.flush_size:
+            await self.flush()
+
+    async def flush(self):
+        """Записать накопленные события одним INSERT"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            # События остаются в буфере до коммита: при ошибке или отмене
+            # (stop во время записи) они будут записаны следующей пачкой
+            events = self._buffer[:]
+            try:
+                async with db.transaction() as cursor:
+                    await cursor.executemany(
+                        "INSERT INTO loyalty_events (user_id, delta, kind) VALUES (%s, %s, %s)",
+                        events
+                    )
+            except Error as e:
+                print(f"Ошибка записи событий лояльности: {e}")
+                return
+            del self._buffer[:len(events)]
+
+    async def refresh_balances(self, batch=FOLD_BATCH):
+        """Добавить к итогам пользователей ещё не учтённые события; вернуть их число или None.
+
+        Учтённость отмечается в самой строке (folded), а не границей по ID: ID
+        выдаются при вставке, и пачка, закоммиченная позже соседних (другой
+        процесс бота), иначе оказалась бы ниже границы и потерялась.
+        """
+        folded = 0
+        while True:
+            try:
+                async with db.transaction() as cursor:
+                    # Блокировка строк: параллельный пересчёт не учтёт их второй раз
+                    await cursor.execute(
+                        "SELECT id, user_id, kind FROM loyalty_events WHERE folded = 0 "
+                        "ORDER BY id LIMIT %s FOR UPDATE",
+                        (batch,)
+                    )
+                    rows = await cursor.fetchall()
+                    if not rows:
+                        return folded
+                    totals = _totals(rows)
+                    await cursor.executemany(
+                        """
+                        INSERT INTO loyalty_balances (user_id, trips, rewards) VALUES (%s, %s, %s)
+                        ON DUPLICATE KEY UPDATE trips = trips + VALUES(trips), rewards = rewards + VALUES(rewards)
+                        """,
+                        [(user_id, trips, rewards) for user_id, (trips, rewards, _) in sorted(totals.items())]
+                    )
+                    ids = [row[0] for row in rows]
+                    await cursor.execute(
+                        f"UPDATE loyalty_events SET folded = 1 WHERE id IN ({', '.join(['%s'] * len(ids))})", ids
+                    )
+            except Error as e:
+                print(f"Ошибка пересчёта итогов лояльности: {e}")
+                return None
+            folded += len(rows)
+            if len(rows) < batch:
+                return folded
+
+    async def compact(self, retention_days=LOYALTY_RETENTION_DAYS, batch=FOLD_BATCH):
+        """Свернуть учтённые в итогах события старше retention_days в loyalty_snapshots"""
+        removed = 0
+        while True:
+            try:
+                async with db.transaction() as cursor:
+                    await cursor.execute(
+                        "SELECT id, user_id, kind FROM loyalty_events "
+                        "WHERE folded = 1 AND created_at < NOW() - INTERVAL %s DAY ORDER BY id LIMIT %s FOR UPDATE",
+                        (retention_days, batch)
+                    )
+                    rows = await cursor.fetchall()
+                    if not rows:
+                        return removed
+                    await cursor.executemany(
+                        """
+                        INSERT INTO loyalty_snapshots (user_id, trips, rewards, last_event_id) VALUES (%s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE trips = trips + VALUES(trips), rewards = rewards + VALUES(rewards),
+                            last_event_id = GREATEST(last_event_id, VALUES(last_event_id))
+                        """,
+                        [(user_id, *item) for user_id, item in sorted(_totals(rows).items())]
+                    )
+                    ids = [row[0] for row in rows]
+                    await cursor.execute(
+                        f"DELETE FROM loyalty_events WHERE id IN ({', '.join(['%s'] * len(ids))})", ids
+                    )
+            except Error as e:
+                print(f"Ошибка сжатия журнала лояльности: {e}")
+                return None
+            removed += len(rows)
+            if len(rows) < batch:
+                return removed
+
+    async def complete_trip(self, user_id):
+        """Учесть поездку: True, если она бесплатная, иначе начислить балл; None при ошибке БД"""
+        free = await db.complete_loyalty_trip(user_id)
+        if free is not None:
+            await self.record_event(user_id, free)
+        return free
+
+    async def get_balance(self, user_id):
+        """Баллы пользователя к следующей бесплатной поездке"""
+        row = await db.fetchone("SELECT loyalty_points FROM users WHERE user_id = %s", (user_id,))
+        return row[0] if row else 0
+
+    def start(self):
+        """Запустить фоновую запись и пересчёт (один раз при старте бота)"""
+        if self._task is None:
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить фоновые задачи и записать остаток буфера.
+
+        Задача не отменяется, а доходит до конца текущей записи: отмена после
+        COMMIT оставила бы события в буфере, и они были бы учтены дважды.
+        """
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_refresh = loop.time() + self.refresh_interval
+        next_compaction = loop.time() + 24 * 3600
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+            if loop.time() >= next_refresh:
+                await self.refresh_balances()
+                next_refresh = loop.time() + self.refresh_interval
+            if loop.time() >= next_compaction:
+                await self.compact()
+                next_compaction = loop.time() + 24 * 3600
+
+
+ledger = LoyaltyLedger()
@@ -0,0 +1,79 @@
+"""Версионированные миграции схемы БД.
+
+Применённые версии хранятся в таблице schema_migrations. Запуск:
+
+    python -m migrations upgrade [--to ВЕРСИЯ]
+    python -m migrations status
+    python -m migrations recount-seats
+"""
+from database import get_pool, release_connection
+from migrations.versions import MIGRATIONS, RECOUNT_SEATS
+
+
+def _ensure_version_table(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT NOT NULL,
+            name VARCHAR(64) NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (version)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """
+    )
+
+
+def applied_versions():
+    """Множество применённых версий"""
+    connection = get_pool().acquire()
+    try:
+        cursor = connection.cursor(buffered=True)
+        _ensure_version_table(cursor)
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        release_connection(connection)
+
+
+def pending(target=None):
+    """Неприменённые миграции до версии target включительно"""
+    applied = applied_versions()
+    return [
+        migration for migration in MIGRATIONS
+        if migration[0] not in applied and (target is None or migration[0] <= target)
+    ]
+
+
+def upgrade(target=None):
+    """Применить все неприменённые миграции по порядку, вернуть их версии"""
+    done = []
+    connection = get_pool().acquire()
+    try:
+        cursor = connection.cursor(buffered=True)
+        for version, name, statements in pending(target):
+            # DDL в MySQL фиксируется сразу, поэтому версия записывается после всех запросов
+            for statement in statements:
+                if callable(statement):
+                    statement(cursor)
+                else:
+                    cursor.execute(statement)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name)
+            )
+            print(f"Применена миграция {version:04d}_{name}")
+            done.append(version)
+    finally:
+        release_connection(connection)
+    return done
+
+
+def recount_seats():
+    """Пересчитать trips.seats_taken по bookings, вернуть число исправленных поездок"""
+    connection = get_pool().acquire()
+    try:
+        cursor = connection.cursor(buffered=True)
+        cursor.execute(RECOUNT_SEATS)
+        return cursor.rowcount
+    finally:
+        release_connection(connection)
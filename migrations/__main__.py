@@ -0,0 +1,36 @@
+import argparse
+import sys
+
+from database import close_pool
+from migrations import applied_versions, recount_seats, upgrade
+from migrations.versions import MIGRATIONS
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m migrations", description="Миграции схемы БД")
+    commands = parser.add_subparsers(dest="command", required=True)
+    upgrade_parser = commands.add_parser("upgrade", help="применить неприменённые миграции")
+    upgrade_parser.add_argument("--to", type=int, default=None, help="остановиться на этой версии")
+    commands.add_parser("status", help="показать состояние миграций")
+    commands.add_parser("recount-seats", help="пересчитать занятые места поездок по броням")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "upgrade":
+            if not upgrade(args.to):
+                print("Схема уже актуальна")
+        elif args.command == "recount-seats":
+            # Кэш расписания работающего бота обновится через SCHEDULE_CACHE_TTL
+            print(f"Исправлен счётчик мест у поездок: {recount_seats()}")
+        else:
+            applied = applied_versions()
+            for version, name, _ in MIGRATIONS:
+                mark = "x" if version in applied else " "
+                print(f"[{mark}] {version:04d}_{name}")
+    finally:
+        close_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+# Миграции схемы: (версия, название, список SQL-запросов).
+# Вместо запроса можно указать функцию от курсора — для изменений, которые
+# зависят от текущей схемы (таблицы, созданные до миграций).
+# Новые миграции добавляются в конец списка, применённые не изменяются.
+
+
+def add_column(table, column, definition):
+    """Шаг миграции: добавить столбец, если его ещё нет"""
+    def step(cursor):
+        cursor.execute(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+            (table, column)
+        )
+        if cursor.fetchone() is None:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+
+def add_index(table, index, columns):
+    """Шаг миграции: создать индекс, если индекса с таким именем ещё нет"""
+    def step(cursor):
+        cursor.execute(
+            "SELECT 1 FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+            (table, index)
+        )
+        if cursor.fetchone() is None:
+            cursor.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+    return step
+
+
+def drop_column(table, column):
+    """Шаг миграции: удалить столбец, если он есть"""
+    def step(cursor):
+        cursor.execute(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+            (table, column)
+        )
+        if cursor.fetchone() is not None:
+            cursor.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+    return step
+
+
+# Пересчёт trips.seats_taken по bookings: миграция 8 и команда recount-seats
+RECOUNT_SEATS = """
+    UPDATE trips
+    LEFT JOIN (SELECT trip_id, SUM(seats) AS taken FROM bookings GROUP BY trip_id) AS b
+        ON b.trip_id = trips.id
+    SET trips.seats_taken = COALESCE(b.taken, 0)
+"""
+
+
+MIGRATIONS = [
+    (1, 'initial', [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT NOT NULL,
+            phone VARCHAR(32) NULL,
+            loyalty_points INT NOT NULL DEFAULT 0,
+            banned TINYINT(1) NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id),
+            KEY idx_users_banned (banned)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS trips (
+            id INT NOT NULL AUTO_INCREMENT,
+            trip_type VARCHAR(16) NOT NULL,
+            date DATE NOT NULL,
+            seats_taken SMALLINT UNSIGNED NOT NULL DEFAULT 0,
+            PRIMARY KEY (id),
+            KEY idx_trips_type_date (trip_type, date)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS bookings (
+            id BIGINT NOT NULL AUTO_INCREMENT,
+            trip_id INT NOT NULL,
+            user_id BIGINT NOT NULL,
+            seats TINYINT UNSIGNED NOT NULL DEFAULT 1,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id),
+            KEY idx_bookings_trip (trip_id),
+            KEY idx_bookings_user (user_id),
+            CONSTRAINT fk_bookings_trip FOREIGN KEY (trip_id) REFERENCES trips (id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS financial_records (
+            id BIGINT NOT NULL AUTO_INCREMENT,
+            date DATE NOT NULL,
+            amount DECIMAL(10, 2) NOT NULL,
+            trip_type VARCHAR(16) NOT NULL,
+            discount_applied DECIMAL(10, 2) NOT NULL DEFAULT 0,
+            bonus_points_used INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (id),
+            KEY idx_financial_date_type (date, trip_type)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+    ]),
+    (2, 'broadcasts', [
+        """
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INT NOT NULL AUTO_INCREMENT,
+            text TEXT NOT NULL,
+            status ENUM('running', 'done') NOT NULL DEFAULT 'running',
+            last_user_id BIGINT NOT NULL DEFAULT 0,
+            sent INT NOT NULL DEFAULT 0,
+            failed INT NOT NULL DEFAULT 0,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id),
+            KEY idx_broadcasts_status (status)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+    ]),
+    (3, 'apscheduler_jobs', [
+        """
+        CREATE TABLE IF NOT EXISTS apscheduler_jobs (
+            id VARCHAR(191) NOT NULL,
+            next_run_time DOUBLE NULL,
+            job_state BLOB NOT NULL,
+            PRIMARY KEY (id),
+            KEY idx_apscheduler_jobs_next_run_time (next_run_time)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+    ]),
+    (4, 'reminders', [
+        """
+        CREATE TABLE IF NOT EXISTS reminders (
+            id BIGINT NOT NULL AUTO_INCREMENT,
+            user_id BIGINT NOT NULL,
+            trip_id INT NOT NULL,
+            hours_before TINYINT UNSIGNED NOT NULL,
+            due_at DATETIME NOT NULL,
+            sent TINYINT(1) NOT NULL DEFAULT 0,
+            PRIMARY KEY (id),
+            UNIQUE KEY uq_reminders_booking (trip_id, user_id, hours_before),
+            KEY idx_reminders_sent_due (sent, due_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+    ]),
+    (5, 'loyalty_ledger', [
+        """
+        CREATE TABLE IF NOT EXISTS loyalty_events (
+            id BIGINT NOT NULL AUTO_INCREMENT,
+            user_id BIGINT NOT NULL,
+            delta INT NOT NULL,
+            kind ENUM('trip', 'reward') NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id),
+            KEY idx_loyalty_events_user (user_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS loyalty_balances (
+            user_id BIGINT NOT NULL,
+            balance INT NOT NULL DEFAULT 0,
+            trips INT NOT NULL DEFAULT 0,
+            rewards INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS loyalty_snapshots (
+            user_id BIGINT NOT NULL,
+            trips INT NOT NULL DEFAULT 0,
+            rewards INT NOT NULL DEFAULT 0,
+            last_event_id BIGINT NOT NULL,
+            PRIMARY KEY (user_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS loyalty_state (
+            name VARCHAR(64) NOT NULL,
+            value BIGINT NOT NULL,
+            PRIMARY KEY (name)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        "INSERT IGNORE INTO loyalty_state (name, value) VALUES ('folded_event_id', 0)",
+        # Переносим накопленные баллы из users.loyalty_points
+        """
+        INSERT IGNORE INTO loyalty_balances (user_id, balance)
+        SELECT user_id, loyalty_points FROM users WHERE loyalty_points > 0
+        """,
+    ]),
+    (6, 'ban_version', [
+        # Номер версии списка блокировок: растёт при каждой блокировке/разблокировке
+        """
+        CREATE TABLE IF NOT EXISTS ban_version (
+            id TINYINT NOT NULL,
+            version BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        "INSERT IGNORE INTO ban_version (id, version) VALUES (1, 0)",
+    ]),
+    (7, 'financial_daily', [
+        # Дневные итоги financial_records по направлению; обновляются вместе с записью
+        """
+        CREATE TABLE IF NOT EXISTS financial_daily (
+            day DATE NOT NULL,
+            trip_type VARCHAR(16) NOT NULL,
+            total DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            records INT NOT NULL DEFAULT 0,
+            discounts DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            bonus_points BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, trip_type)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """,
+        """
+        INSERT IGNORE INTO financial_daily (day, trip_type, total, records, discounts, bonus_points)
+        SELECT date, trip_type, SUM(amount), COUNT(*), SUM(discount_applied), SUM(bonus_points_used)
+        FROM financial_records
+        GROUP BY date, trip_type
+        """,
+    ]),
+    (8, 'trips_seats_taken', [
+        # Таблица trips из первой версии бота хранила passengers и не имела счётчика мест
+        add_column('trips', 'seats_taken', "SMALLINT UNSIGNED NOT NULL DEFAULT 0"),
+        add_column('bookings', 'seats', "TINYINT UNSIGNED NOT NULL DEFAULT 1"),
+        # Заполняем счётчик по существующим броням, иначе старые поездки можно перебронировать
+        RECOUNT_SEATS,
+    ]),
+    (9, 'existing_tables_indexes', [
+        # Индексы из первой миграции для таблиц, созданных до неё (CREATE TABLE IF NOT EXISTS их не трогает)
+        add_index('trips', 'idx_trips_type_date', "trip_type, date"),
+        add_index('bookings', 'idx_bookings_trip', "trip_id"),
+        add_index('bookings', 'idx_bookings_user', "user_id"),
+        add_index('users', 'idx_users_banned', "banned"),
+        add_index('financial_records', 'idx_financial_date_type', "date, trip_type"),
+    ]),
+    (10, 'trips_date_index', [
+        # Расписание в админменю листается по (date, id) без направления
+        add_index('trips', 'idx_trips_date', "date"),
+    ]),
+    (11, 'drop_user_reminder_jobs', [
+        # Напоминания по пользователю заменены задачей на поездку, их функции больше нет
+        "DELETE FROM apscheduler_jobs WHERE id NOT LIKE 'trip\\_reminder\\_%'",
+    ]),
+    (12, 'loyalty_counter_authority', [
+        # Баллы — только users.loyalty_points, в журнале остаются итоги поездок и наград
+        drop_column('loyalty_balances', 'balance'),
+    ]),
+    (13, 'loyalty_events_folded', [
+        # Учтённость события в итогах отмечается в строке; граница folded_event_id больше не используется
+        add_column('loyalty_events', 'folded', "TINYINT(1) NOT NULL DEFAULT 0"),
+        """
+        UPDATE loyalty_events SET folded = 1
+        WHERE id <= (SELECT value FROM loyalty_state WHERE name = 'folded_event_id')
+        """,
+        add_index('loyalty_events', 'idx_loyalty_events_folded', "folded, id"),
+    ]),
+]
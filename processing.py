@@ -0,0 +1,132 @@
+"""Параллельная обработка обновлений с очередностью внутри одного пользователя.
+
+Обновления разных пользователей обрабатываются одновременно (не больше
+max_active сразу), а обновления одного пользователя — строго по очереди,
+иначе два быстрых нажатия (confirm_booking, затем handle_multi_booking) гонялись
+бы за общими context.user_data. Подключается через
+ApplicationBuilder.application_class.
+"""
+import asyncio
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import Application
+
+
+class KeyedLocks:
+    """Блокировки по ключу; запись удаляется, когда её никто не держит и не ждёт.
+
+    max_pending ограничивает число ждущих по одному ключу (None — без ограничения).
+    """
+
+    def __init__(self, max_pending=None):
+        self.max_pending = max_pending
+        self._locks = {}  # ключ -> [asyncio.Lock, число держащих и ждущих]
+
+    def __len__(self):
+        return len(self._locks)
+
+    async def acquire(self, key):
+        """Взять блокировку ключа; False, если по ключу уже ждут max_pending"""
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        elif self.max_pending is not None and entry[1] > self.max_pending:
+            return False  # один держит и max_pending ждут
+        entry[1] += 1
+        try:
+            await entry[0].acquire()
+        except BaseException:
+            self._leave(key, entry)
+            raise
+        return True
+
+    def release(self, key):
+        entry = self._locks[key]
+        entry[0].release()
+        self._leave(key, entry)
+
+    def _leave(self, key, entry):
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._locks[key]
+
+
+def update_key(update):
+    """Ключ очередности: пользователь, иначе чат; None — обновление без владельца"""
+    if isinstance(update, Update):
+        if update.effective_user is not None:
+            return ('user', update.effective_user.id)
+        if update.effective_chat is not None:
+            return ('chat', update.effective_chat.id)
+    return None
+
+
+class UserSerialApplication(Application):
+    """Application, который упорядочивает обновления по пользователю.
+
+    concurrent_updates задаёт, сколько обновлений взято из очереди одновременно
+    (включая ждущих своей очереди), max_active — сколько из них выполняется.
+    Ждущие не занимают рабочих мест, но занимают места concurrent_updates,
+    поэтому у одного пользователя ждут не больше max_pending обновлений:
+    лишние отбрасываются (на нажатие кнопки отвечаем, чтобы оно не висело).
+    """
+
+    def __init__(self, *, max_active, max_pending=None, **kwargs):
+        super().__init__(**kwargs)
+        self.max_active = max_active
+        self.waiting = 0  # взяты из очереди и ждут очереди пользователя или рабочего места
+        self.active = 0
+        self.max_waiting = 0
+        self.rejected = 0  # отброшены: у пользователя уже ждут max_pending обновлений
+        self._user_locks = KeyedLocks(max_pending)
+        self._active_semaphore = None
+
+    async def process_update(self, update):
+        if self._active_semaphore is None:
+            self._active_semaphore = asyncio.Semaphore(self.max_active)
+        key = update_key(update)
+
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            if key is not None and not await self._user_locks.acquire(key):
+                self.rejected += 1
+                await self._reject(update)
+                return
+            try:
+                await self._active_semaphore.acquire()
+            except BaseException:
+                if key is not None:
+                    self._user_locks.release(key)
+                raise
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        try:
+            await super().process_update(update)
+        finally:
+            self.active -= 1
+            self._active_semaphore.release()
+            if key is not None:
+                self._user_locks.release(key)
+
+    async def _reject(self, update):
+        if update.callback_query is None:
+            return
+        try:
+            await update.callback_query.answer("Подождите, предыдущие действия ещё выполняются")
+        except TelegramError as e:
+            print(f"Ошибка ответа на отброшенное нажатие: {e}")
+
+    def stats(self):
+        """Глубина очередей для мониторинга"""
+        return {
+            'queued': self.update_queue.qsize(),  # ещё не взяты из очереди
+            'waiting': self.waiting,
+            'active': self.active,
+            'max_waiting': self.max_waiting,
+            'rejected': self.rejected,
+            'users': len(self._user_locks),
+        }
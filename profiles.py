@@ -0,0 +1,107 @@
+"""Кэш профилей пользователей (телефон, блокировка) перед таблицей users.
+
+Ограниченный по размеру LRU с временем жизни записи. Функции записи в users
+(database.py, async_database.py) сбрасывают запись пользователя, ttl
+ограничивает устаревание, если users меняет другой процесс. Чтение через кэш —
+async_database.get_user_profile / get_user_profiles.
+"""
+import sys
+import time
+from collections import OrderedDict
+
+from config import PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL
+
+# Примерные накладные расходы OrderedDict на одну запись (ключ, ссылки, узел списка)
+_ENTRY_OVERHEAD = 100
+
+
+class UserProfile:
+    """Профиль пользователя из таблицы users"""
+    __slots__ = ('user_id', 'phone', 'banned', 'expires')
+
+    def __init__(self, user_id, phone=None, banned=False, expires=0.0):
+        self.user_id = user_id
+        self.phone = phone
+        self.banned = banned
+        self.expires = expires  # time.monotonic(), после которого запись устарела
+
+    def size(self):
+        """Примерный объём записи в памяти, байт"""
+        size = sys.getsizeof(self) + _ENTRY_OVERHEAD
+        if self.phone is not None:
+            size += sys.getsizeof(self.phone)
+        return size
+
+
+class ProfileCache:
+    """LRU+TTL кэш профилей с учётом памяти и статистикой попаданий"""
+
+    def __init__(self, max_size=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.memory = 0  # байт, см. UserProfile.size
+        self._profiles = OrderedDict()
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def get(self, user_id):
+        """Свежий профиль из кэша или None"""
+        profile = self._profiles.get(user_id)
+        if profile is None or profile.expires < time.monotonic():
+            self.misses += 1
+            return None
+        self._profiles.move_to_end(user_id)
+        self.hits += 1
+        return profile
+
+    @property
+    def generation(self):
+        """Номер версии: запомнить перед запросом к БД и передать в put"""
+        return self._generation
+
+    def put(self, profile, generation):
+        """Сохранить загруженный профиль, если с начала запроса не было записей в users"""
+        if generation != self._generation:
+            return
+        self._remove(profile.user_id)
+        profile.expires = time.monotonic() + self.ttl
+        self._profiles[profile.user_id] = profile
+        self.memory += profile.size()
+        while len(self._profiles) > self.max_size:
+            _, evicted = self._profiles.popitem(last=False)
+            self.memory -= evicted.size()
+            self.evictions += 1
+
+    def invalidate(self, user_id=None):
+        """Сбросить профиль пользователя (или весь кэш) после записи в users"""
+        self._generation += 1
+        if user_id is None:
+            self._profiles.clear()
+            self.memory = 0
+        else:
+            self._remove(user_id)
+
+    def stats(self):
+        """Статистика кэша для мониторинга"""
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._profiles),
+            'memory': self.memory,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def _remove(self, user_id):
+        profile = self._profiles.pop(user_id, None)
+        if profile is not None:
+            self.memory -= profile.size()
+
+
+profile_cache = ProfileCache()
@@ -0,0 +1,283 @@
+"""Напоминания о каждой брони (за 24 ч и за 1 ч до поездки) на куче в памяти.
+
+Все напоминания хранятся в таблице reminders, в памяти — только ближайшее окно
+(REMINDER_WINDOW секунд): компактные записи со __slots__ в min-куче по времени.
+Вставка O(log n), отмена — пометка записи с удалением при извлечении.
+Включается настройкой REMINDER_BACKEND = 'booking'.
+"""
+import asyncio
+import heapq
+import time
+
+from aiomysql import Error
+from config import TRIP_TYPES, REMINDER_OFFSETS, REMINDER_WINDOW, REMINDER_MISFIRE_GRACE
+from broadcast import send_many
+import async_database as db
+
+
+class Reminder:
+    """Запись об одном напоминании"""
+    __slots__ = ('due', 'reminder_id', 'user_id', 'trip_id', 'hours_before', 'cancelled')
+
+    def __init__(self, due, reminder_id, user_id, trip_id, hours_before):
+        self.due = due  # Unix-время отправки
+        self.reminder_id = reminder_id
+        self.user_id = user_id
+        self.trip_id = trip_id
+        self.hours_before = hours_before
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.due, self.reminder_id) < (other.due, other.reminder_id)
+
+
+class ReminderQueue:
+    """Min-куча напоминаний с отменой по ID"""
+
+    def __init__(self):
+        self._heap = []
+        self._by_id = {}
+        self._cancelled = 0
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def push(self, reminder):
+        """Добавить напоминание (повторное добавление того же ID игнорируется)"""
+        if reminder.reminder_id in self._by_id:
+            return False
+        self._by_id[reminder.reminder_id] = reminder
+        heapq.heappush(self._heap, reminder)
+        return True
+
+    def cancel(self, reminder_id):
+        """Отменить напоминание; запись удаляется из кучи при извлечении"""
+        reminder = self._by_id.pop(reminder_id, None)
+        if reminder is None:
+            return False
+        reminder.cancelled = True
+        self._cancelled += 1
+        # Если отменённых больше половины, перестраиваем кучу, чтобы не держать мусор
+        if self._cancelled > len(self._heap) // 2:
+            self._heap = [item for item in self._heap if not item.cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+        return True
+
+    def next_due(self):
+        """Время ближайшего напоминания или None"""
+        self._drop_cancelled()
+        return self._heap[0].due if self._heap else None
+
+    def pop_due(self, now):
+        """Извлечь все напоминания со временем не позже now"""
+        due = []
+        while True:
+            self._drop_cancelled()
+            if not self._heap or self._heap[0].due > now:
+                return due
+            reminder = heapq.heappop(self._heap)
+            del self._by_id[reminder.reminder_id]
+            due.append(reminder)
+
+    def _drop_cancelled(self):
+        heap = self._heap
+        while heap and heap[0].cancelled:
+            heapq.heappop(heap)
+            self._cancelled -= 1
+
+
+class ReminderService:
+    """Отправка напоминаний из таблицы reminders в цикле событий бота"""
+
+    def __init__(self, window=REMINDER_WINDOW, grace=REMINDER_MISFIRE_GRACE):
+        self.window = window
+        self.grace = grace
+        self.queue = ReminderQueue()
+        self.loaded_until = None  # в памяти все неотправленные напоминания раньше этого времени
+        self.loading_until = None  # граница окна, которое сейчас загружается
+        self._cancelled_while_loading = set()
+        self.bot = None
+        self._wakeup = None
+        self._task = None
+        self._sending = set()
+
+    def start(self, bot):
+        """Запустить обработку напоминаний (один раз при старте бота)"""
+        self.bot = bot
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить обработку напоминаний"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            if self.loaded_until is None or now >= self.loaded_until - self.window / 2:
+                if not await self._load_window(now):
+                    await asyncio.sleep(5)  # БД недоступна, повторим позже
+                    continue
+
+            due = self.queue.pop_due(now)
+            if due:
+                task = asyncio.create_task(self._fire(due))
+                self._sending.add(task)
+                task.add_done_callback(self._sending.discard)
+
+            next_due = self.queue.next_due()
+            refresh_at = self.loaded_until - self.window / 2
+            wake_at = refresh_at if next_due is None else min(next_due, refresh_at)
+            timeout = max(wake_at - time.time(), 0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _push(self, reminder):
+        # Во время загрузки сравниваем с новым окном: запрос мог уже пройти мимо
+        # напоминания, закоммиченного после него. Повтор из запроса push отбросит
+        until = self.loaded_until if self.loading_until is None else self.loading_until
+        if until is not None and reminder.due < until:
+            next_due = self.queue.next_due()
+            if self.queue.push(reminder) and (next_due is None or reminder.due < next_due):
+                self._wakeup.set()
+
+    async def _load_window(self, now):
+        """Подгрузить неотправленные напоминания до now + window; False при ошибке БД"""
+        until = now + self.window
+        self.loading_until = until
+        try:
+            reminders = await self._fetch(self.loaded_until, until)
+        finally:
+            self.loading_until = None
+            cancelled, self._cancelled_while_loading = self._cancelled_while_loading, set()
+        if reminders is None:
+            return False
+        for reminder in reminders:
+            if reminder.reminder_id not in cancelled:
+                self.queue.push(reminder)
+        self.loaded_until = until
+        return True
+
+    async def _fetch(self, start, until):
+        if start is None:
+            # Первая загрузка: включая пропущенные, пока бот был остановлен
+            rows = await db.fetchall(
+                "SELECT id, UNIX_TIMESTAMP(due_at), user_id, trip_id, hours_before FROM reminders "
+                "WHERE sent = 0 AND due_at < FROM_UNIXTIME(%s)",
+                (until,)
+            )
+        else:
+            rows = await db.fetchall(
+                "SELECT id, UNIX_TIMESTAMP(due_at), user_id, trip_id, hours_before FROM reminders "
+                "WHERE sent = 0 AND due_at >= FROM_UNIXTIME(%s) AND due_at < FROM_UNIXTIME(%s)",
+                (start, until)
+            )
+        if rows is None:
+            return None
+        return [
+            Reminder(float(due), reminder_id, user_id, trip_id, hours_before)
+            for reminder_id, due, user_id, trip_id, hours_before in rows
+        ]
+
+    async def _fire(self, reminders):
+        """Отправить сработавшие напоминания, сгруппировав по поездке"""
+        now = time.time()
+        groups = {}
+        for reminder in reminders:
+            # Слишком старые (бот долго был остановлен) помечаем без отправки
+            if now - reminder.due <= self.grace:
+                groups.setdefault((reminder.trip_id, reminder.hours_before), []).append(reminder.user_id)
+
+        trips = {}
+        if groups:
+            trip_ids = sorted({trip_id for trip_id, _ in groups})
+            rows = await db.fetchall(
+                f"SELECT id, trip_type, date FROM trips WHERE id IN ({', '.join(['%s'] * len(trip_ids))})",
+                trip_ids
+            )
+            if rows is None:
+                return  # Не помечаем отправленными: подхватятся при следующем запуске
+            trips = {trip_id: (trip_type, date) for trip_id, trip_type, date in rows}
+
+        for (trip_id, hours_before), user_ids in groups.items():
+            if trip_id not in trips:
+                continue
+            trip_type, date = trips[trip_id]
+            when = "завтра" if hours_before >= 24 else f"через {hours_before} ч."
+            await send_many(self.bot, user_ids, f"🚨 Напоминание: ваша поездка {TRIP_TYPES[trip_type]} {date} {when}!")
+
+        await self._mark_sent([reminder.reminder_id for reminder in reminders])
+
+    async def _mark_sent(self, reminder_ids):
+        await db.execute(
+            f"UPDATE reminders SET sent = 1 WHERE id IN ({', '.join(['%s'] * len(reminder_ids))})",
+            reminder_ids
+        )
+
+    async def add_for_booking(self, user_id, trip_id):
+        """Создать напоминания о брони (за REMINDER_OFFSETS часов до поездки)"""
+        try:
+            async with db.transaction() as cursor:
+                inserted = []
+                for hours_before in REMINDER_OFFSETS:
+                    await cursor.execute(
+                        "INSERT IGNORE INTO reminders (user_id, trip_id, hours_before, due_at) "
+                        "SELECT %s, id, %s, TIMESTAMP(date) - INTERVAL %s HOUR FROM trips "
+                        "WHERE id = %s AND TIMESTAMP(date) - INTERVAL %s HOUR > NOW()",
+                        (user_id, hours_before, hours_before, trip_id, hours_before)
+                    )
+                    if cursor.rowcount > 0:
+                        inserted.append(hours_before)
+                # В очередь кладём только вставленные сейчас: уже существовавшие строки
+                # загружает окно, и они могут прямо сейчас отправляться в _fire
+                rows = []
+                if inserted:
+                    await cursor.execute(
+                        "SELECT id, UNIX_TIMESTAMP(due_at), hours_before FROM reminders "
+                        f"WHERE trip_id = %s AND user_id = %s AND hours_before IN ({', '.join(['%s'] * len(inserted))})",
+                        (trip_id, user_id, *inserted)
+                    )
+                    rows = await cursor.fetchall()
+        except Error as e:
+            print(f"Ошибка создания напоминаний: {e}")
+            return
+
+        for reminder_id, due, hours_before in rows:
+            self._push(Reminder(float(due), reminder_id, user_id, int(trip_id), hours_before))
+
+    async def cancel_for_booking(self, user_id, trip_id):
+        """Удалить напоминания об отменённой брони"""
+        try:
+            async with db.transaction() as cursor:
+                await cursor.execute(
+                    "SELECT id FROM reminders WHERE trip_id = %s AND user_id = %s AND sent = 0 FOR UPDATE",
+                    (trip_id, user_id)
+                )
+                rows = await cursor.fetchall()
+                await cursor.execute(
+                    "DELETE FROM reminders WHERE trip_id = %s AND user_id = %s AND sent = 0",
+                    (trip_id, user_id)
+                )
+        except Error as e:
+            print(f"Ошибка удаления напоминаний: {e}")
+            return
+
+        for (reminder_id,) in rows:
+            self.queue.cancel(reminder_id)
+            if self.loading_until is not None:
+                # Загружаемое окно могло прочитать строку до удаления
+                self._cancelled_while_loading.add(reminder_id)
+
+
+reminder_service = ReminderService()
@@ -0,0 +1,151 @@
+"""Финансовые отчёты за период: выручка по направлениям, скидки, расходы на лояльность.
+
+Записи читаются серверным курсором пачками, агрегация пачек идёт в пуле
+процессов, в цикле событий бота остаётся только чтение из БД и сложение
+готовых итогов. Одновременно в работе не больше REPORT_INFLIGHT пачек, поэтому
+память ограничена независимо от периода.
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from decimal import Decimal
+
+from telegram.constants import MessageLimit
+
+from config import TRIP_TYPES, REPORT_WORKERS, REPORT_BATCH, REPORT_INFLIGHT
+import async_database as db
+
+_executor = None
+_tasks = set()
+
+
+def get_executor():
+    """Пул процессов для отчётов (создаётся при первом обращении)"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=REPORT_WORKERS)
+    return _executor
+
+
+def shutdown_executor():
+    """Остановить пул процессов (при остановке бота)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+# Выполняется в процессе пула: только простые данные на входе и выходе
+def aggregate_batch(rows):
+    """Итоги пачки строк (date, amount, trip_type, discount, bonus_points).
+
+    Возвращает {(месяц 'ГГГГ-ММ', trip_type): [выручка, поездок, скидки, баллы, поездок с баллами]}.
+    """
+    totals = {}
+    for day, amount, trip_type, discount, bonus_points in rows:
+        key = (day.strftime('%Y-%m'), trip_type)
+        item = totals.get(key)
+        if item is None:
+            item = totals[key] = [Decimal(0), 0, Decimal(0), 0, 0]
+        item[0] += amount
+        item[1] += 1
+        item[2] += discount
+        item[3] += bonus_points
+        if bonus_points:
+            item[4] += 1
+    return totals
+
+
+def merge_totals(target, totals):
+    """Прибавить итоги пачки к общим"""
+    for key, item in totals.items():
+        current = target.get(key)
+        if current is None:
+            target[key] = item
+        else:
+            for index, value in enumerate(item):
+                current[index] += value
+    return target
+
+
+def format_report(totals, start, end):
+    """Текст отчёта по общим итогам"""
+    if not totals:
+        return f"📊 Отчёт за {start} — {end}: записей нет."
+
+    routes = {}
+    months = {}
+    for (month, trip_type), item in totals.items():
+        merge_totals(routes, {trip_type: list(item)})
+        merge_totals(months, {month: list(item)})
+    revenue, trips, discounts, bonus_points, bonus_trips = (sum(column) for column in zip(*routes.values()))
+
+    lines = [f"📊 Отчёт за {start} — {end} (не включая)", f"Всего: {revenue} ₽, поездок {trips}", ""]
+    lines.append("По направлениям:")
+    for trip_type, (route_revenue, route_trips, route_discounts, _, _) in sorted(routes.items()):
+        lines.append(f"• {TRIP_TYPES.get(trip_type, trip_type)}: {route_revenue} ₽, поездок {route_trips}, "
+                     f"средний чек {route_revenue / route_trips:.2f} ₽, скидки {route_discounts} ₽")
+    lines.append("")
+    lines.append("По месяцам:")
+    for month, (month_revenue, month_trips, _, _, _) in sorted(months.items()):
+        lines.append(f"• {month}: {month_revenue} ₽, поездок {month_trips}")
+    lines.append("")
+    gross = revenue + discounts
+    share = discounts / gross * 100 if gross else 0
+    lines.append(f"Скидки: {discounts} ₽ ({share:.1f}% от выручки без скидок)")
+    lines.append(f"Лояльность: списано баллов {bonus_points}, поездок с баллами {bonus_trips}")
+    return "\n".join(lines)
+
+
+async def build_report(start, end):
+    """Собрать отчёт за даты [start, end); исключения БД передаются вызывающему"""
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    totals = {}
+    inflight = set()
+    async for rows in db.stream(
+        "SELECT date, amount, trip_type, discount_applied, bonus_points_used FROM financial_records "
+        "WHERE date >= %s AND date < %s",
+        (start, end),
+        batch=REPORT_BATCH
+    ):
+        inflight.add(loop.run_in_executor(executor, aggregate_batch, list(rows)))
+        if len(inflight) >= REPORT_INFLIGHT:
+            done, inflight = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                merge_totals(totals, future.result())
+    for totals_part in await asyncio.gather(*inflight):
+        merge_totals(totals, totals_part)
+    return await loop.run_in_executor(executor, format_report, totals, start, end)
+
+
+def parse_period(args):
+    """Период отчёта из аргументов команды: ГГГГ-ММ, ГГГГ или две даты ГГГГ-ММ-ДД; None, если не разобрать"""
+    try:
+        if len(args) == 2:
+            return date.fromisoformat(args[0]), date.fromisoformat(args[1])
+        if len(args) == 1 and len(args[0]) == 7:
+            start = date.fromisoformat(args[0] + "-01")
+            return start, date(start.year + start.month // 12, start.month % 12 + 1, 1)
+        if len(args) == 1 and len(args[0]) == 4:
+            return date(int(args[0]), 1, 1), date(int(args[0]) + 1, 1, 1)
+    except ValueError:
+        pass
+    return None
+
+
+async def _send_report(bot, chat_id, start, end):
+    try:
+        text = await build_report(start, end)
+    except Exception as e:
+        print(f"Ошибка построения отчёта: {e}")
+        text = "❌ Не удалось построить отчёт."
+    await bot.send_message(chat_id=chat_id, text=text[:MessageLimit.MAX_TEXT_LENGTH])
+
+
+def request_report(bot, chat_id, start, end):
+    """Построить отчёт в фоне и отправить его в чат chat_id"""
+    task = asyncio.create_task(_send_report(bot, chat_id, start, end))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
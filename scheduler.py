@@ -1,23 +1,219 @@
-from apscheduler.schedulers.background import BackgroundScheduler
+import asyncio
+import pickle
 from datetime import datetime, timedelta
 
-scheduler = BackgroundScheduler()
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+from mysql.connector import IntegrityError
+from broadcast import send_many
+from config import REMINDER_BACKEND, REMINDER_MISFIRE_GRACE
+from database import transaction
+import async_database as async_db
 
-def schedule_trip_reminder(context, user_id, trip_info, trip_date):
-    """Планирование напоминания о поездке"""
-    job_time = datetime.strptime(trip_date, '%Y-%m-%d') - timedelta(hours=1)
 
-    scheduler.add_job(
-        send_reminder,
-        'date',
-        run_date=job_time,
-        args=[context, user_id, trip_info]
-    )
-    scheduler.start()
+class MySQLJobStore(BaseJobStore):
+    """Хранилище задач APScheduler в таблице apscheduler_jobs (см. миграции)"""
+
+    def __init__(self, pickle_protocol=pickle.HIGHEST_PROTOCOL):
+        super().__init__()
+        self.pickle_protocol = pickle_protocol
+
+    def lookup_job(self, job_id):
+        with transaction(readonly=True) as cursor:
+            cursor.execute("SELECT job_state FROM apscheduler_jobs WHERE id = %s", (job_id,))
+            row = cursor.fetchone()
+        return self._reconstitute_job(row[0]) if row else None
+
+    def get_due_jobs(self, now):
+        return self._get_jobs("WHERE next_run_time <= %s", (datetime_to_utc_timestamp(now),))
+
+    def get_next_run_time(self):
+        with transaction(readonly=True) as cursor:
+            cursor.execute(
+                "SELECT next_run_time FROM apscheduler_jobs WHERE next_run_time IS NOT NULL "
+                "ORDER BY next_run_time LIMIT 1"
+            )
+            row = cursor.fetchone()
+        return utc_timestamp_to_datetime(row[0]) if row else None
+
+    def get_all_jobs(self):
+        jobs = self._get_jobs()
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+
+    def add_job(self, job):
+        try:
+            with transaction() as cursor:
+                cursor.execute(
+                    "INSERT INTO apscheduler_jobs (id, next_run_time, job_state) VALUES (%s, %s, %s)",
+                    (job.id, datetime_to_utc_timestamp(job.next_run_time), self._dump(job))
+                )
+        except IntegrityError:
+            raise ConflictingIdError(job.id)
+
+    def update_job(self, job):
+        with transaction() as cursor:
+            cursor.execute(
+                "UPDATE apscheduler_jobs SET next_run_time = %s, job_state = %s WHERE id = %s",
+                (datetime_to_utc_timestamp(job.next_run_time), self._dump(job), job.id)
+            )
+            if cursor.rowcount == 0:
+                raise JobLookupError(job.id)
+
+    def remove_job(self, job_id):
+        with transaction() as cursor:
+            cursor.execute("DELETE FROM apscheduler_jobs WHERE id = %s", (job_id,))
+            if cursor.rowcount == 0:
+                raise JobLookupError(job_id)
+
+    def remove_all_jobs(self):
+        with transaction() as cursor:
+            cursor.execute("DELETE FROM apscheduler_jobs")
+
+    def _dump(self, job):
+        return pickle.dumps(job.__getstate__(), self.pickle_protocol)
+
+    def _reconstitute_job(self, job_state):
+        job_state = pickle.loads(job_state)
+        job_state['jobstore'] = self
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _get_jobs(self, condition="", params=()):
+        jobs = []
+        failed_job_ids = []
+        with transaction() as cursor:
+            cursor.execute(
+                f"SELECT id, job_state FROM apscheduler_jobs {condition} ORDER BY next_run_time",
+                params
+            )
+            for job_id, job_state in cursor.fetchall():
+                try:
+                    jobs.append(self._reconstitute_job(job_state))
+                except BaseException:
+                    self._logger.exception('Unable to restore job "%s" -- removing it', job_id)
+                    failed_job_ids.append(job_id)
+
+            # Удаляем задачи, которые не удалось восстановить
+            for job_id in failed_job_ids:
+                cursor.execute("DELETE FROM apscheduler_jobs WHERE id = %s", (job_id,))
+        return jobs
+
+
+# Задачи переживают перезапуск, пропущенные за время простоя выполняются один раз.
+# Планировщик работает в своём потоке: хранилище ходит в БД синхронным
+# mysql-connector и не должно останавливать цикл событий бота. Задача только
+# передаёт рассылку в цикл событий, поэтому хватает одного рабочего потока
+scheduler = BackgroundScheduler(
+    jobstores={'default': MySQLJobStore()},
+    executors={'default': ThreadPoolExecutor(1)},
+    job_defaults={'coalesce': True, 'misfire_grace_time': REMINDER_MISFIRE_GRACE}
+)
+_bot = None
+_loop = None
+
+
+def _in_thread(func, *args):
+    """Выполнить синхронный вызов планировщика вне цикла событий"""
+    return asyncio.get_running_loop().run_in_executor(None, func, *args)
+
 
-def send_reminder(context, user_id, trip_info):
-    """Отправка напоминания пользователю"""
-    context.bot.send_message(
-        chat_id=user_id,
-        text=f"🚨 Напоминание: ваша поездка {trip_info} начнется через час!"
+def start_scheduler(bot):
+    """Запустить поток планировщика (один раз при старте, из цикла событий бота)"""
+    global _bot, _loop
+    _bot = bot
+    _loop = asyncio.get_running_loop()
+    if not scheduler.running:
+        scheduler.start()
+
+
+async def shutdown_scheduler():
+    """Остановить планировщик, дождавшись его потока вне цикла событий"""
+    if scheduler.running:
+        await _in_thread(scheduler.shutdown, False)
+
+
+def _reminder_time(trip_date):
+    """Время напоминания: за час до поездки; None, если оно уже прошло"""
+    if isinstance(trip_date, str):
+        trip_date = datetime.strptime(trip_date, '%Y-%m-%d')
+    elif not isinstance(trip_date, datetime):
+        trip_date = datetime.combine(trip_date, datetime.min.time())
+    job_time = trip_date - timedelta(hours=1)
+    return job_time if job_time > datetime.now() else None
+
+
+def _add_reminder_jobs(reminders):
+    for trip_id, trip_info, job_time in reminders:
+        try:
+            scheduler.add_job(
+                send_trip_reminder,
+                'date',
+                run_date=job_time,
+                args=[trip_id, trip_info],
+                id=f"trip_reminder_{trip_id}"
+            )
+        except ConflictingIdError:
+            pass
+
+
+def _remove_reminder_job(trip_id):
+    try:
+        scheduler.remove_job(f"trip_reminder_{trip_id}")
+    except JobLookupError:
+        pass
+
+
+async def schedule_trip_reminders(trips):
+    """Планирование напоминаний для поездок [(trip_id, trip_info, trip_date)], одна задача на поездку"""
+    if REMINDER_BACKEND != 'trip':
+        return
+    reminders = []
+    for trip_id, trip_info, trip_date in trips:
+        job_time = _reminder_time(trip_date)
+        if job_time is not None:
+            reminders.append((trip_id, trip_info, job_time))
+    if reminders:
+        await _in_thread(_add_reminder_jobs, reminders)
+
+
+async def schedule_trip_reminder(trip_id, trip_info, trip_date):
+    """Планирование напоминания пассажирам поездки"""
+    await schedule_trip_reminders([(trip_id, trip_info, trip_date)])
+
+
+async def cancel_trip_reminder(trip_id):
+    """Отменить напоминание об удалённой поездке"""
+    await _in_thread(_remove_reminder_job, trip_id)
+
+
+def send_trip_reminder(trip_id, trip_info):
+    """Задача планировщика: передать рассылку напоминания в цикл событий бота, не дожидаясь её"""
+    future = asyncio.run_coroutine_threadsafe(_send_trip_reminder(trip_id, trip_info), _loop)
+    future.add_done_callback(_report_reminder_error)
+
+
+def _report_reminder_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Ошибка рассылки напоминания: {future.exception()}")
+
+
+async def _send_trip_reminder(trip_id, trip_info):
+    """Отправка напоминания всем пассажирам поездки"""
+    rows = await async_db.fetchall(
+        "SELECT DISTINCT user_id FROM bookings WHERE trip_id = %s",
+        (trip_id,)
     )
+    if rows:
+        await send_many(
+            _bot,
+            [row[0] for row in rows],
+            f"🚨 Напоминание: ваша поездка {trip_info} начнется через час!"
+        )
+
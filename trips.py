@@ -0,0 +1,263 @@
+import datetime
+import time
+
+from aiomysql import Error
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from config import TRIP_TYPES, MAX_SEATS, SCHEDULE_CACHE_TTL, TRIPS_PAGE_SIZE, SCHEDULE_PAGE_SIZE
+from scheduler import schedule_trip_reminder, schedule_trip_reminders, cancel_trip_reminder
+import async_database as db
+
+
+def seats_left(seats_taken):
+    """Свободные места по значению счётчика seats_taken"""
+    return max(MAX_SEATS - seats_taken, 0)
+
+
+def build_trips_keyboard(trip_type, page):
+    """Клавиатура выбора поездки для страницы расписания"""
+    keyboard = [
+        [InlineKeyboardButton(f"Дата: {date} (ID: {trip_id}), свободно мест: {seats_left(seats_taken)}",
+                              callback_data=f"confirm_booking_{trip_type}_{trip_id}")]
+        for trip_id, date, seats_taken in page.trips
+    ]
+
+    navigation = []
+    if page.has_prev:
+        first_id, first_date, _ = page.trips[0]
+        navigation.append(InlineKeyboardButton(
+            "◀️ Раньше", callback_data=f"trips_{trip_type}_p_{first_date:%Y-%m-%d}_{first_id}"))
+    if page.has_next:
+        last_id, last_date, _ = page.trips[-1]
+        navigation.append(InlineKeyboardButton(
+            "Позже ▶️", callback_data=f"trips_{trip_type}_n_{last_date:%Y-%m-%d}_{last_id}"))
+    if navigation:
+        keyboard.append(navigation)
+
+    keyboard.append([InlineKeyboardButton("Назад", callback_data='start')])
+    return InlineKeyboardMarkup(keyboard)
+
+
+class TripPage:
+    """Страница предстоящих поездок направления"""
+    __slots__ = ('trips', 'has_prev', 'has_next', 'markup', 'loaded_at')
+
+    def __init__(self, trips, has_prev, has_next, loaded_at):
+        self.trips = trips  # список (id, date, seats_taken)
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.markup = None
+        self.loaded_at = loaded_at
+
+    def keyboard(self, trip_type):
+        """Клавиатура страницы (собирается один раз)"""
+        if self.markup is None:
+            self.markup = build_trips_keyboard(trip_type, self)
+        return self.markup
+
+
+async def load_page(trip_type, cursor=None, backward=False, limit=TRIPS_PAGE_SIZE):
+    """Загрузить страницу предстоящих поездок (keyset-пагинация по (date, id)).
+
+    ``cursor`` — (date, id) крайней поездки соседней страницы: следующая страница
+    начинается после него, при ``backward`` — заканчивается перед ним. Запросы
+    идут по индексу idx_trips_type_date и не зависят от размера истории.
+    """
+    if cursor is None:
+        rows = await db.fetchall(
+            "SELECT id, date, seats_taken FROM trips WHERE trip_type = %s AND date >= CURDATE() "
+            "ORDER BY date, id LIMIT %s",
+            (trip_type, limit + 1)
+        )
+    elif not backward:
+        date, trip_id = cursor
+        rows = await db.fetchall(
+            "SELECT id, date, seats_taken FROM trips WHERE trip_type = %s AND date >= CURDATE() "
+            "AND (date > %s OR (date = %s AND id > %s)) ORDER BY date, id LIMIT %s",
+            (trip_type, date, date, trip_id, limit + 1)
+        )
+    else:
+        date, trip_id = cursor
+        rows = await db.fetchall(
+            "SELECT id, date, seats_taken FROM trips WHERE trip_type = %s AND date >= CURDATE() "
+            "AND (date < %s OR (date = %s AND id < %s)) ORDER BY date DESC, id DESC LIMIT %s",
+            (trip_type, date, date, trip_id, limit + 1)
+        )
+    if rows is None:
+        return None
+
+    rows = list(rows)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+        return TripPage(rows, more, True, time.monotonic())
+    return TripPage(rows, cursor is not None, more, time.monotonic())
+
+
+class ScheduleCache:
+    """Кэш страниц расписания по направлению (ключи из TRIP_TYPES).
+
+    Хранит страницы со строками (id, date, seats_taken) и собранной
+    клавиатурой. Сбрасывается при добавлении/удалении поездки и со сменой дня,
+    места обновляются при бронировании; ttl ограничивает устаревание, если
+    расписание меняет другой процесс.
+    """
+
+    max_pages = 256
+
+    def __init__(self, ttl=SCHEDULE_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._pages = {}  # (trip_type, cursor, backward) -> TripPage
+        self._generation = 0
+        self._day = datetime.date.today()
+
+    async def get_page(self, trip_type, cursor=None, backward=False):
+        """Страница поездок направления (None при ошибке БД)"""
+        today = datetime.date.today()
+        if today != self._day:
+            # Вчерашние поездки больше не предстоящие
+            self._day = today
+            self.invalidate()
+
+        key = (trip_type, cursor, backward)
+        page = self._pages.get(key)
+        if page is not None and time.monotonic() - page.loaded_at < self.ttl:
+            self.hits += 1
+            return page
+
+        self.misses += 1
+        generation = self._generation
+        page = await load_page(trip_type, cursor, backward)
+        # Если расписание поменялось, пока шёл запрос, результат не сохраняем
+        if page is not None and generation == self._generation:
+            if len(self._pages) >= self.max_pages:
+                self._pages.clear()
+            self._pages[key] = page
+        return page
+
+    async def get_trips(self, trip_type):
+        """Ближайшие поездки направления: список (id, date, seats_taken)"""
+        page = await self.get_page(trip_type)
+        return page.trips if page else []
+
+    def invalidate(self, trip_type=None):
+        """Сбросить кэш направления (или весь кэш)"""
+        self._generation += 1
+        if trip_type is None:
+            self._pages.clear()
+        else:
+            for key in [key for key in self._pages if key[0] == trip_type]:
+                del self._pages[key]
+
+    def update_seats(self, trip_id, seats_taken):
+        """Обновить занятые места поездки после бронирования или отмены"""
+        trip_id = int(trip_id)
+        self._generation += 1
+        for page in self._pages.values():
+            for index, (cached_id, date, _) in enumerate(page.trips):
+                if cached_id == trip_id:
+                    page.trips[index] = (cached_id, date, seats_taken)
+                    page.markup = None
+
+    def stats(self):
+        """Счётчики попаданий и промахов"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': len(self._pages),
+        }
+
+
+schedule_cache = ScheduleCache()
+
+
+async def get_schedule_page(cursor=None, backward=False, limit=SCHEDULE_PAGE_SIZE):
+    """Страница всего расписания для админа, включая прошедшие поездки.
+
+    Без ``cursor`` начинается с сегодняшних поездок, «назад» листает в прошлое.
+    ``cursor`` — (date, id) крайней поездки соседней страницы; запросы идут по
+    индексу idx_trips_date, кэш расписания для пассажиров не используется.
+    Возвращает (строки (id, trip_type, date, seats_taken), есть_раньше, есть_дальше)
+    или None при ошибке БД.
+    """
+    if cursor is None:
+        rows = await db.fetchall(
+            "SELECT id, trip_type, date, seats_taken FROM trips WHERE date >= CURDATE() "
+            "ORDER BY date, id LIMIT %s",
+            (limit + 1,)
+        )
+        past = await db.fetchone("SELECT 1 FROM trips WHERE date < CURDATE() LIMIT 1")
+    elif not backward:
+        date, trip_id = cursor
+        rows = await db.fetchall(
+            "SELECT id, trip_type, date, seats_taken FROM trips "
+            "WHERE date > %s OR (date = %s AND id > %s) ORDER BY date, id LIMIT %s",
+            (date, date, trip_id, limit + 1)
+        )
+    else:
+        date, trip_id = cursor
+        rows = await db.fetchall(
+            "SELECT id, trip_type, date, seats_taken FROM trips "
+            "WHERE date < %s OR (date = %s AND id < %s) ORDER BY date DESC, id DESC LIMIT %s",
+            (date, date, trip_id, limit + 1)
+        )
+    if rows is None:
+        return None
+
+    rows = list(rows)
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+        return rows, more, True
+    if cursor is None:
+        return rows, past is not None, more
+    return rows, True, more
+
+
+async def add_trip(trip_type, date):
+    """Добавить поездку в расписание, вернуть её ID"""
+    try:
+        async with db.transaction() as cursor:
+            await cursor.execute(
+                "INSERT INTO trips (trip_type, date) VALUES (%s, %s)",
+                (trip_type, date)
+            )
+            trip_id = cursor.lastrowid
+    except Error as e:
+        print(f"Ошибка добавления поездки: {e}")
+        return None
+    schedule_cache.invalidate(trip_type)
+    await schedule_trip_reminder(trip_id, f"{TRIP_TYPES[trip_type]} {date}", date)
+    return trip_id
+
+
+async def remove_trip(trip_id):
+    """Удалить поездку без броней; вернуть True, если удалена"""
+    trip = await db.fetchone("SELECT trip_type FROM trips WHERE id = %s", (trip_id,))
+    if not trip:
+        return False
+    deleted = await db.execute(
+        "DELETE FROM trips WHERE id = %s AND seats_taken = 0",
+        (trip_id,)
+    )
+    schedule_cache.invalidate(trip[0])
+    if deleted:
+        await cancel_trip_reminder(trip_id)
+    return bool(deleted)
+
+
+async def schedule_missing_reminders():
+    """Запланировать напоминания для предстоящих поездок, у которых их нет"""
+    trips = await db.fetchall(
+        "SELECT trips.id, trips.trip_type, trips.date FROM trips "
+        "LEFT JOIN apscheduler_jobs ON apscheduler_jobs.id = CONCAT('trip_reminder_', trips.id) "
+        "WHERE trips.date >= CURDATE() AND apscheduler_jobs.id IS NULL"
+    )
+    await schedule_trip_reminders(
+        [(trip_id, f"{TRIP_TYPES[trip_type]} {date}", date) for trip_id, trip_type, date in trips or ()]
+    )